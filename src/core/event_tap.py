@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Event tap helper - installs a Quartz event tap and always tears it down
+"""
+
+from contextlib import contextmanager
+from Quartz import (
+    CGEventTapCreate, CGEventTapEnable,
+    kCGSessionEventTap, kCGHeadInsertEventTap,
+    kCGEventTapOptionDefault,
+    CFRunLoopGetCurrent, CFMachPortCreateRunLoopSource, CFMachPortInvalidate,
+    CFRunLoopAddSource, CFRunLoopRemoveSource, kCFRunLoopDefaultMode
+)
+
+@contextmanager
+def event_tap(mask, callback):
+    """Install a session event tap on the current thread's run loop
+
+    Yields the tap, or None if it couldn't be created (usually missing
+    accessibility permissions). On exit the tap is disabled, removed from
+    the run loop and invalidated so it stops receiving events.
+    """
+    tap = CGEventTapCreate(
+        kCGSessionEventTap,
+        kCGHeadInsertEventTap,
+        kCGEventTapOptionDefault,
+        mask,
+        callback,
+        None
+    )
+    if not tap:
+        yield None
+        return
+
+    source = CFMachPortCreateRunLoopSource(None, tap, 0)
+    run_loop = CFRunLoopGetCurrent()
+    CFRunLoopAddSource(run_loop, source, kCFRunLoopDefaultMode)
+    try:
+        yield tap
+    finally:
+        CGEventTapEnable(tap, False)
+        CFRunLoopRemoveSource(run_loop, source, kCFRunLoopDefaultMode)
+        CFMachPortInvalidate(tap)
@@ -6,17 +6,40 @@ Script Recorder - Records user actions and converts them to Simon Says script fo
 import json
 import time
 import os
+import sys
+import queue
+import threading
+try:
+    import orjson  # Optional: faster JSON parsing/serializing when installed
+except ImportError:
+    orjson = None
+from collections import defaultdict, deque
 from datetime import datetime
 from Quartz import (
-    CGEventMaskBit, CGEventTapCreate, CGEventGetLocation, CGEventGetIntegerValueField,
+    CGEventMaskBit, CGEventGetLocation, CGEventGetIntegerValueField,
     kCGEventLeftMouseDown, kCGEventLeftMouseUp, kCGEventRightMouseDown, kCGEventRightMouseUp,
     kCGEventMouseMoved, kCGEventKeyDown, kCGEventKeyUp, kCGKeyboardEventKeycode,
     kCGEventOtherMouseDown, kCGEventOtherMouseUp, kCGMouseEventButtonNumber,
-    kCGSessionEventTap, kCGHeadInsertEventTap,
-    CFRunLoopGetCurrent, CFRunLoopRun, CFRunLoopStop,
-    CFMachPortCreateRunLoopSource, CFRunLoopAddSource, kCFRunLoopDefaultMode,
+    CFRunLoopGetCurrent, CFRunLoopRunInMode, CFRunLoopStop,
+    kCFRunLoopDefaultMode, kCFRunLoopRunTimedOut,
     CGEventGetFlags
 )
+from event_tap import event_tap
+
+def dump_json(data):
+    """Serialize data as indented JSON bytes"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode()
+
+# Mouse button events the recorder turns into commands
+MOUSE_BUTTON_EVENTS = frozenset({
+    kCGEventLeftMouseDown, kCGEventLeftMouseUp,
+    kCGEventRightMouseDown, kCGEventRightMouseUp
+})
+
+# Every event type the recorder acts on once recording has started
+RECORDED_EVENTS = MOUSE_BUTTON_EVENTS | {kCGEventKeyDown}
 
 # Key code to name mapping for common keys
 KEYCODE_NAMES = {
@@ -45,69 +68,205 @@ CHAR_KEYCODES = {
     47: '.', 43: ',', 44: '/', 41: ';', 39: "'", 33: '[', 30: ']', 42: '\\', 27: '-', 24: '=', 50: '`'
 }
 
+# Shifted versions of symbol keys
+SHIFT_MAP = {
+    '1': '!', '2': '@', '3': '#', '4': '$', '5': '%',
+    '6': '^', '7': '&', '8': '*', '9': '(', '0': ')',
+    '-': '_', '=': '+', '[': '{', ']': '}', '\\': '|',
+    ';': ':', "'": '"', ',': '<', '.': '>', '/': '?',
+    '`': '~'
+}
+
+# Keycode-indexed lookup tables (macOS virtual keycodes fit below 128)
+KEYCODE_LIMIT = 128
+KEYNAME_TABLE = tuple(KEYCODE_NAMES.get(code) for code in range(KEYCODE_LIMIT))
+CHAR_TABLE = tuple(CHAR_KEYCODES.get(code) for code in range(KEYCODE_LIMIT))
+SHIFTED_CHAR_TABLE = tuple(
+    (char.upper() if char.isalpha() else SHIFT_MAP.get(char, char)) if char else None
+    for char in CHAR_TABLE
+)
+
+# Keycode categories, one byte per keycode
+KEY_UNKNOWN, KEY_MODIFIER, KEY_SPECIAL, KEY_CHAR = range(4)
+MODIFIER_KEYCODES = (54, 55, 56, 58, 59, 60, 61, 62)  # cmd, shift, option, ctrl (left/right)
+KEY_CATEGORY = bytes(
+    KEY_MODIFIER if code in MODIFIER_KEYCODES
+    else KEY_SPECIAL if KEYNAME_TABLE[code]
+    else KEY_CHAR if CHAR_TABLE[code]
+    else KEY_UNKNOWN
+    for code in range(KEYCODE_LIMIT)
+)
+
+# Modifier flag bits: shift 0x20000, ctrl 0x40000, option 0x80000, cmd 0x100000
+COMBO_FLAGS = 0x100000 | 0x40000  # Cmd or Ctrl turns a keypress into a combination
+
+# "cmd+ctrl+shift+option+" style prefixes indexed by (flags >> 17) & 0xF
+MODIFIER_PREFIXES = tuple(
+    ''.join(f"{name}+" for bit, name in ((8, 'cmd'), (2, 'ctrl'), (1, 'shift'), (4, 'option'))
+            if mask & bit)
+    for mask in range(16)
+)
+
+# Persisted counter for the next recording number
+NEXT_ID_FILE = "recordings/.next_id"
+
+# Clicks within this many pixels of a saved location reuse it
+LOCATION_THRESHOLD = 20
+
+# Cell size (pixels) for the spatial hash used by nearest-location lookups
+GRID_CELL_SIZE = LOCATION_THRESHOLD
+
+# Gaps between events that turn into wait commands
+PAUSE_NS = 500_000_000          # 0.5s
+PAUSE_MEDIUM_NS = 1_000_000_000  # 1s
+PAUSE_LONG_NS = 2_000_000_000    # 2s
+
+# Identical mouse events closer together than this are treated as duplicates
+DEBOUNCE_NS = 5_000_000  # 5ms
+
+# Middle clicks closer together than this don't toggle recording again
+TOGGLE_DEBOUNCE_NS = 50_000_000  # 50ms
+
+def compact_events(events, merge_waits=max):
+    """Merge runs of wait commands with merge_waits (max or sum)
+
+    max suits the usual case, a fixed safety wait followed by the pause
+    wait for the same idle gap. sum keeps gaps that really were separate,
+    such as pauses around a keystroke that produced no command.
+    Moves repeated by the next click are left in; playback drops those.
+    """
+    pending = None  # Previous command, held back so it can be merged
+    in_code_block = False
+    for event in events:
+        # Code block contents are passed through untouched
+        if in_code_block or event == '```':
+            if event == '```':
+                in_code_block = not in_code_block
+            if pending is not None:
+                yield pending
+                pending = None
+            yield event
+            continue
+        
+        if pending is not None:
+            if pending.startswith('wait ') and event.startswith('wait '):
+                event = f"wait {round(merge_waits((float(pending[5:]), float(event[5:]))), 2)}"
+            else:
+                yield pending
+        pending = event
+    
+    if pending is not None:
+        yield pending
+
 class ScriptRecorder:
-    def __init__(self, locations_file=None):
+    def __init__(self, locations_file=None, merge_waits=max):
         self.base_locations_file = locations_file
+        self.merge_waits = merge_waits  # How back-to-back waits combine when saving
         self.locations = self.load_locations()
+        self._grid = defaultdict(list)  # (cell_x, cell_y) -> [(name, x, y), ...]
+        for name, loc in self.locations.items():
+            self._index_location(name, loc['x'], loc['y'])
         self.events = []
-        self.start_time = None
+        self.start_ns = None  # time.monotonic_ns() when recording started
         self.is_recording = False
-        self.current_text_buffer = ""
-        self.last_event_time = 0
-        self.click_counter = 1  # For generating location names
+        self.current_text_buffer = []  # Typed characters, joined on flush
+        self.last_event_ns = 0
+        self.new_location_count = 0  # Locations created during this recording
+        # Next free click_N number, past any loaded click_N names
+        self.next_click_id = 1 + max(
+            (int(name[6:]) for name in self.locations
+             if name.startswith('click_') and name[6:].isdigit()),
+            default=0
+        )
         self.locations_modified = False  # Track if we need to save locations
         self.recording_locations_file = None  # Separate locations file for this recording
         self.last_click_location = None  # Track last click location for moves
-        self.mouse_down_time = None  # Track when mouse was pressed down
+        self.mouse_down_ns = None  # Track when mouse was pressed down
         self.mouse_down_location = None  # Track where mouse was pressed down
+        self.mouse_down_xy = None  # Track raw coordinates of the mouse down
         self.mouse_down_button = None  # Track which button was pressed
+        self._log = []  # Event log lines, printed when recording stops
+        self._ticked = False  # A line of click dots is waiting for its newline
+        self._write_queue = queue.Queue()  # (path, bytes, message) for the background writer
+        threading.Thread(target=self._file_writer, daemon=True).start()
+        self._recent_events = deque(maxlen=4)  # Recent (type, x, y, ns) for debouncing
+        self.last_toggle_ns = None  # When a middle click last started or stopped recording
+        os.makedirs("recordings", exist_ok=True)
         
     def load_locations(self):
         """Load existing locations to match clicks to named locations"""
         if self.base_locations_file and os.path.exists(self.base_locations_file):
             try:
-                with open(self.base_locations_file, 'r') as f:
-                    return json.load(f)
+                with open(self.base_locations_file, 'rb') as f:
+                    raw = f.read()
+                return orjson.loads(raw) if orjson else json.loads(raw)
             except:
                 return {}
         return {}
     
-    def find_nearest_location(self, x, y, threshold=20):
+    def _index_location(self, name, x, y):
+        """Add a location to the spatial hash grid"""
+        self._grid[(x // GRID_CELL_SIZE, y // GRID_CELL_SIZE)].append((name, x, y))
+    
+    def find_nearest_location(self, x, y, threshold=LOCATION_THRESHOLD):
         """Find the nearest saved location within threshold pixels"""
         nearest_name = None
-        nearest_distance = float('inf')
-        
-        for name, loc in self.locations.items():
-            distance = ((x - loc['x'])**2 + (y - loc['y'])**2)**0.5
-            if distance < threshold and distance < nearest_distance:
-                nearest_distance = distance
-                nearest_name = name
+        nearest_distance = threshold * threshold  # Compare squared distances
+        
+        # Only scan grid cells that can hold a location within threshold
+        cell_x, cell_y = x // GRID_CELL_SIZE, y // GRID_CELL_SIZE
+        reach = -(-threshold // GRID_CELL_SIZE)
+        for gx in range(cell_x - reach, cell_x + reach + 1):
+            for gy in range(cell_y - reach, cell_y + reach + 1):
+                cell = self._grid.get((gx, gy))
+                if not cell:
+                    continue
+                for name, loc_x, loc_y in cell:
+                    dx = x - loc_x
+                    dy = y - loc_y
+                    distance = dx * dx + dy * dy
+                    if distance < nearest_distance:
+                        nearest_distance = distance
+                        nearest_name = name
         
         return nearest_name
     
     def save_new_location(self, x, y):
         """Save a new click location with an auto-generated name"""
         # Generate a unique location name
-        while True:
-            location_name = f"click_{self.click_counter}"
-            if location_name not in self.locations:
-                break
-            self.click_counter += 1
+        location_name = f"click_{self.next_click_id}"
+        self.next_click_id += 1
         
         # Save the location
         self.locations[location_name] = {'x': x, 'y': y}
+        self._index_location(location_name, x, y)
         self.locations_modified = True
-        self.click_counter += 1
+        self.new_location_count += 1
         
         return location_name
     
     def get_next_recording_id(self):
         """Get the next simple recording ID (rec1, rec2, etc.)"""
-        if not os.path.exists("recordings"):
-            os.makedirs("recordings", exist_ok=True)
-            return "rec1"
+        # Read the persisted counter, scanning the folder only to bootstrap it
+        try:
+            with open(NEXT_ID_FILE, 'r') as f:
+                next_num = int(f.read())
+        except (FileNotFoundError, ValueError):
+            next_num = self.scan_next_recording_number()
+        
+        # Skip past any folder created without updating the counter
+        while os.path.exists(f"recordings/rec{next_num}"):
+            next_num += 1
         
-        # Find existing recordings
+        tmp_file = f"{NEXT_ID_FILE}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(str(next_num + 1))
+        os.replace(tmp_file, NEXT_ID_FILE)
+        
+        return f"rec{next_num}"
+    
+    def scan_next_recording_number(self):
+        """Find the next recording number by scanning the recordings folder"""
         existing = []
         for item in os.listdir("recordings"):
             if os.path.isdir(f"recordings/{item}") and item.startswith("rec"):
@@ -119,29 +278,72 @@ class ScriptRecorder:
         
         # Return next number
         if existing:
-            return f"rec{max(existing) + 1}"
+            return max(existing) + 1
         else:
-            return "rec1"
+            return 1
     
     def save_locations(self):
         """Save locations to the recording-specific locations file"""
         if self.locations_modified and self.recording_locations_file:
+            self.write_file(self.recording_locations_file, dump_json(self.locations),
+                            f"💾 Recording locations saved to {self.recording_locations_file}")
+            self.locations_modified = False
+    
+    def write_file(self, path, data, message=None):
+        """Queue a file write so it happens off the event tap thread
+        
+        message is printed once the file is actually in place.
+        """
+        self._write_queue.put((path, data, message))
+    
+    def _file_writer(self):
+        """Background thread that writes queued files
+        
+        Each file is written to a temporary sibling and renamed into place,
+        so an interrupted write never leaves a half-written file behind.
+        """
+        while True:
+            path, data, message = self._write_queue.get()
             try:
-                with open(self.recording_locations_file, 'w') as f:
-                    json.dump(self.locations, f, indent=2)
-                print(f"💾 Recording locations saved to {self.recording_locations_file}")
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb', buffering=0) as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                if message:
+                    print(message)
             except Exception as e:
-                print(f"⚠️  Error saving locations: {e}")
-            self.locations_modified = False
+                print(f"⚠️  Error saving {path}: {e}")
+            finally:
+                self._write_queue.task_done()
+    
+    def log(self, message):
+        """Queue an event log line instead of printing from the event tap"""
+        self._log.append(message)
+    
+    def tick(self):
+        """Print one dot per recorded click so a live recording is visible"""
+        sys.stdout.write('.')
+        sys.stdout.flush()
+        self._ticked = True
+    
+    def flush_log(self):
+        """Print all queued event log lines in one write"""
+        if self._ticked:
+            sys.stdout.write('\n')  # End the line of click dots
+            self._ticked = False
+        if self._log:
+            sys.stdout.write('\n'.join(self._log) + '\n')
+            sys.stdout.flush()
+            self._log.clear()
     
     def flush_text_buffer(self):
         """Convert accumulated text to script commands"""
         if not self.current_text_buffer:
             return
         
-        text = self.current_text_buffer.strip()
+        text = ''.join(self.current_text_buffer).strip()
         if not text:
-            self.current_text_buffer = ""
+            self.current_text_buffer.clear()
             return
         
         # Check if it's a single line or multiple lines
@@ -151,7 +353,7 @@ class ScriptRecorder:
             # Single line - use type command
             command = f'type "{text}"'
             self.events.append(command)
-            print(f"\n[Captured text: \"{text}\"]")
+            self.log(f"[Captured text: \"{text}\"]")
         else:
             # Multiple lines - use code block format
             self.events.append('type code block')
@@ -159,92 +361,106 @@ class ScriptRecorder:
             for line in lines:
                 self.events.append(line)
             self.events.append('```')
-            print(f"\n[Captured code block: {len(lines)} lines]")
+            self.log(f"[Captured code block: {len(lines)} lines]")
         
-        self.current_text_buffer = ""
+        self.current_text_buffer.clear()
     
     def keycode_to_char(self, keycode, flags):
         """Convert keycode to character, considering modifiers"""
+        if keycode >= KEYCODE_LIMIT:
+            return None, False
+        category = KEY_CATEGORY[keycode]
+        
         # Check if it's a special key
-        if keycode in KEYCODE_NAMES:
-            return KEYCODE_NAMES[keycode], True  # True = special key
+        if category == KEY_SPECIAL:
+            return KEYNAME_TABLE[keycode], True  # True = special key
         
-        # Check if it's a regular character
-        if keycode in CHAR_KEYCODES:
-            char = CHAR_KEYCODES[keycode]
-            
-            # Check for shift modifier
+        # Regular character, using the shifted table when shift is held
+        if category == KEY_CHAR:
             if flags & 0x20000:  # Shift flag
-                if char.isalpha():
-                    return char.upper(), False
-                else:
-                    # Handle shifted symbols
-                    shift_map = {
-                        '1': '!', '2': '@', '3': '#', '4': '$', '5': '%',
-                        '6': '^', '7': '&', '8': '*', '9': '(', '0': ')',
-                        '-': '_', '=': '+', '[': '{', ']': '}', '\\': '|',
-                        ';': ':', "'": '"', ',': '<', '.': '>', '/': '?',
-                        '`': '~'
-                    }
-                    return shift_map.get(char, char), False
-            else:
-                return char, False
+                return SHIFTED_CHAR_TABLE[keycode], False
+            return CHAR_TABLE[keycode], False
         
         return None, False
     
-    def handle_key_combination(self, keycode, flags, current_time):
+    def elapsed(self, current_ns):
+        """Seconds since recording started"""
+        return (current_ns - self.start_ns) / 1e9
+    
+    def is_duplicate_event(self, event_type, x, y, current_ns):
+        """Check if a mouse event repeats one delivered just before it"""
+        for prev_type, prev_x, prev_y, prev_ns in self._recent_events:
+            if (prev_type == event_type and prev_x == x and prev_y == y
+                    and current_ns - prev_ns < DEBOUNCE_NS):
+                return True
+        self._recent_events.append((event_type, x, y, current_ns))
+        return False
+    
+    def handle_key_combination(self, keycode, flags, current_ns):
         """Handle key combinations like cmd+s, ctrl+c, etc."""
-        # Check for modifier keys
-        cmd_pressed = bool(flags & 0x100000)  # Command key
-        ctrl_pressed = bool(flags & 0x40000)   # Control key  
-        shift_pressed = bool(flags & 0x20000)  # Shift key
-        option_pressed = bool(flags & 0x80000) # Option key
-        
         # Only handle combinations, not lone modifier keys
-        if not (cmd_pressed or ctrl_pressed) or keycode in [55, 59, 56, 58]:  # Skip lone modifiers
+        if not flags & COMBO_FLAGS or keycode >= KEYCODE_LIMIT:
             return False
             
-        # Get the base key name
-        key_name = CHAR_KEYCODES.get(keycode) or KEYCODE_NAMES.get(keycode)
-        if not key_name:
+        # Get the base key name (modifiers and unknown keys have none)
+        category = KEY_CATEGORY[keycode]
+        if category == KEY_CHAR:
+            key_name = CHAR_TABLE[keycode]
+        elif category == KEY_SPECIAL:
+            key_name = KEYNAME_TABLE[keycode]
+        else:
             return False
         
         # Flush text buffer before key combination
         self.flush_text_buffer()
         
         # Build the combination command
-        modifiers = []
-        if cmd_pressed:
-            modifiers.append("cmd")
-        if ctrl_pressed:
-            modifiers.append("ctrl")
-        if shift_pressed:
-            modifiers.append("shift")
-        if option_pressed:
-            modifiers.append("option")
-            
-        command = f"press {'+'.join(modifiers)}+{key_name}"
+        command = f"press {MODIFIER_PREFIXES[(flags >> 17) & 0xF]}{key_name}"
         self.events.append(command)
-        print(f"[{current_time - self.start_time:.1f}s] {command}")
+        self.log(f"[{self.elapsed(current_ns):.1f}s] {command}")
         
         return True  # Handled
     
-    def event_callback(self, proxy, event_type, event, refcon):
-        """Handle recorded events"""
-        current_time = time.time()
+    def event_callback(self, proxy, event_type, event, refcon,
+                       _monotonic_ns=time.monotonic_ns,
+                       _get_location=CGEventGetLocation,
+                       _get_int_field=CGEventGetIntegerValueField,
+                       _get_flags=CGEventGetFlags,
+                       _recorded_events=RECORDED_EVENTS,
+                       _mouse_button_events=MOUSE_BUTTON_EVENTS,
+                       _other_mouse_down=kCGEventOtherMouseDown,
+                       _left_down=kCGEventLeftMouseDown, _left_up=kCGEventLeftMouseUp,
+                       _right_down=kCGEventRightMouseDown, _right_up=kCGEventRightMouseUp,
+                       _key_down=kCGEventKeyDown, _key_up=kCGEventKeyUp):
+        """Handle recorded events
+        
+        The keyword defaults bind hot module globals as fast locals; the event
+        tap only ever passes the four positional arguments.
+        """
+        # Until recording starts only the middle click matters, so every
+        # other event goes straight back before any other work
+        if not self.is_recording and event_type != _other_mouse_down:
+            return event
+        
+        current_ns = _monotonic_ns()
         
         # Check for middle mouse click to toggle recording
-        if event_type == kCGEventOtherMouseDown:
-            button = CGEventGetIntegerValueField(event, kCGMouseEventButtonNumber)
+        if event_type == _other_mouse_down:
+            button = _get_int_field(event, kCGMouseEventButtonNumber)
             if button == 2:  # Middle mouse button (button 2)
+                # A repeated middle click from a high polling rate mouse would
+                # stop the recording it just started
+                if self.last_toggle_ns is not None and current_ns - self.last_toggle_ns < TOGGLE_DEBOUNCE_NS:
+                    return None
+                self.last_toggle_ns = current_ns
                 if not self.is_recording:
                     self.is_recording = True
-                    self.start_time = current_time
+                    self.start_ns = current_ns
                     self.events = []
-                    self.current_text_buffer = ""
-                    self.last_event_time = current_time
+                    self.current_text_buffer = []
+                    self.last_event_ns = current_ns
                     self.last_click_location = None
-                    self.click_counter = 1
+                    self.new_location_count = 0
                     
                     # Create recording folder and files with simple counter
                     self.recording_id = self.get_next_recording_id()
@@ -257,14 +473,15 @@ class ScriptRecorder:
                     
                     print("\n🔴 RECORDING STARTED - Middle click again to stop")
                     print(f"📍 Locations will be saved to: {self.recording_locations_file}")
-                    print("Perform your actions...")
+                    print("Perform your actions (each click prints a dot, the event log prints when recording stops)...")
                     print("-" * 40)
                     return None  # Consume the middle click event
                 else:
                     self.is_recording = False
+                    self.flush_text_buffer()  # Save any remaining text
+                    self.flush_log()
                     print("-" * 40)
                     print("⏹ RECORDING STOPPED")
-                    self.flush_text_buffer()  # Save any remaining text
                     self.save_script()
                     # Stop the run loop to exit
                     CFRunLoopStop(CFRunLoopGetCurrent())
@@ -274,45 +491,52 @@ class ScriptRecorder:
         if not self.is_recording:
             return event
         
+        # Pass through event types that never produce commands (key up, etc.)
+        if event_type not in _recorded_events:
+            return event
+        
+        # Drop duplicate mouse events from high-frequency devices
+        if event_type in _mouse_button_events:
+            loc = _get_location(event)
+            x, y = int(loc.x), int(loc.y)
+            if self.is_duplicate_event(event_type, x, y, current_ns):
+                return event
+        
         # Add wait commands for delays and flush text on pauses
-        time_since_last = current_time - self.last_event_time
-        if time_since_last > 0.5:  # More than 0.5 seconds indicates a pause
+        ns_since_last = current_ns - self.last_event_ns
+        if ns_since_last > PAUSE_NS:  # More than 0.5 seconds indicates a pause
             # Flush any accumulated text before the wait
-            if self.current_text_buffer.strip():
+            if ''.join(self.current_text_buffer).strip():
                 self.flush_text_buffer()
-                print(f"\n[Text flushed after pause]")
+                self.log(f"[Text flushed after pause]")
             
             # Add wait command if we have other events
             if self.events:
                 # Round to nearest 0.25 second for more precise timing
-                if time_since_last >= 2.0:
+                if ns_since_last >= PAUSE_LONG_NS:
                     wait_time = 0.6  # 0.5 * 1.25
-                elif time_since_last >= 1.0:
+                elif ns_since_last >= PAUSE_MEDIUM_NS:
                     wait_time = 0.4  # 0.3 * 1.25 (rounded)
                 else:
                     wait_time = 0.25  # 0.2 * 1.25
                 
                 self.events.append(f"wait {wait_time}")
-                print(f"[Added wait {wait_time}s]")
+                self.log(f"[Added wait {wait_time}s]")
         
-        self.last_event_time = current_time
+        self.last_event_ns = current_ns
         
         # Handle mouse clicks
-        if event_type in [kCGEventLeftMouseDown, kCGEventLeftMouseUp, 
-                         kCGEventRightMouseDown, kCGEventRightMouseUp]:
-            
-            loc = CGEventGetLocation(event)
-            x, y = int(loc.x), int(loc.y)
+        if event_type in _mouse_button_events:
             
             # Handle mouse down events - start tracking for potential drag
-            if event_type in [kCGEventLeftMouseDown, kCGEventRightMouseDown]:
+            if event_type == _left_down or event_type == _right_down:
                 # Flush any pending text before mouse action
                 self.flush_text_buffer()
                 
-                button = 'left' if event_type == kCGEventLeftMouseDown else 'right'
+                button = 'left' if event_type == _left_down else 'right'
                 
                 # Start tracking this mouse down for potential drag
-                self.mouse_down_time = current_time
+                self.mouse_down_ns = current_ns
                 self.mouse_down_button = button
                 
                 # Try to find an existing nearby location
@@ -321,29 +545,36 @@ class ScriptRecorder:
                 if not location_name:
                     # Save new location and use it
                     location_name = self.save_new_location(x, y)
-                    print(f"[{current_time - self.start_time:.1f}s] Saved new location '{location_name}' at ({x}, {y})")
+                    self.log(f"[{self.elapsed(current_ns):.1f}s] Saved new location '{location_name}' at ({x}, {y})")
                 
                 self.mouse_down_location = location_name
+                self.mouse_down_xy = (x, y)
                 
                 # Add mouse movement if we have a previous click location
                 if self.last_click_location and self.last_click_location != location_name:
                     move_command = f"move mouse to {location_name}"
                     self.events.append(move_command)
-                    print(f"[{current_time - self.start_time:.1f}s] {move_command}")
+                    self.log(f"[{self.elapsed(current_ns):.1f}s] {move_command}")
                 
-                print(f"[{current_time - self.start_time:.1f}s] Mouse down at {location_name} - waiting for release...")
+                self.log(f"[{self.elapsed(current_ns):.1f}s] Mouse down at {location_name} - waiting for release...")
                 
             # Handle mouse up events - determine if it was click or drag
-            elif event_type in [kCGEventLeftMouseUp, kCGEventRightMouseUp]:
-                if self.mouse_down_time is not None:
-                    hold_duration = current_time - self.mouse_down_time
-                    button = 'left' if event_type == kCGEventLeftMouseUp else 'right'
+            elif event_type == _left_up or event_type == _right_up:
+                if self.mouse_down_ns is not None:
+                    hold_duration = (current_ns - self.mouse_down_ns) / 1e9
+                    button = 'left' if event_type == _left_up else 'right'
                     
-                    # Find location for mouse up position
-                    up_location_name = self.find_nearest_location(x, y)
+                    # Find location for mouse up position, reusing the mouse down
+                    # location when the pointer barely moved (the common click case)
+                    down_x, down_y = self.mouse_down_xy
+                    dx, dy = x - down_x, y - down_y
+                    if dx * dx + dy * dy < LOCATION_THRESHOLD * LOCATION_THRESHOLD:
+                        up_location_name = self.mouse_down_location
+                    else:
+                        up_location_name = self.find_nearest_location(x, y)
                     if not up_location_name:
                         up_location_name = self.save_new_location(x, y)
-                        print(f"[{current_time - self.start_time:.1f}s] Saved new location '{up_location_name}' at ({x}, {y})")
+                        self.log(f"[{self.elapsed(current_ns):.1f}s] Saved new location '{up_location_name}' at ({x}, {y})")
                     
                     # Determine if this was a click, hold, or drag
                     if hold_duration > 0.5:  # Held for more than 0.5 seconds
@@ -358,31 +589,33 @@ class ScriptRecorder:
                         command = f"{button} click at {self.mouse_down_location}"
                     
                     self.events.append(command)
-                    print(f"[{current_time - self.start_time:.1f}s] {command}")
+                    self.log(f"[{self.elapsed(current_ns):.1f}s] {command}")
+                    self.tick()
                     
                     # Add automatic safety delay after mouse action
                     self.events.append("wait 0.25") 
-                    print(f"[Added UI safety delay: 0.25s]")
+                    self.log(f"[Added UI safety delay: 0.25s]")
                     
                     # Remember this location for next move
                     self.last_click_location = up_location_name
                     
                     # Reset tracking
-                    self.mouse_down_time = None
+                    self.mouse_down_ns = None
                     self.mouse_down_location = None
+                    self.mouse_down_xy = None
                     self.mouse_down_button = None
         
         # Handle keyboard events
-        elif event_type in [kCGEventKeyDown, kCGEventKeyUp]:
-            keycode = CGEventGetIntegerValueField(event, kCGKeyboardEventKeycode)
-            flags = CGEventGetFlags(event)
+        elif event_type == _key_down or event_type == _key_up:
+            keycode = _get_int_field(event, kCGKeyboardEventKeycode)
+            flags = _get_flags(event)
             
             # No need to skip any keys now since we're using middle click
             
             # Only process key down events
-            if event_type == kCGEventKeyDown:
+            if event_type == _key_down:
                 # Check for modifier key combinations first
-                if self.handle_key_combination(keycode, flags, current_time):
+                if self.handle_key_combination(keycode, flags, current_ns):
                     return event
                 
                 char, is_special = self.keycode_to_char(keycode, flags)
@@ -393,29 +626,27 @@ class ScriptRecorder:
                         if char in ['backspace', 'delete']:
                             # Handle delete keys - remove from buffer if possible
                             if self.current_text_buffer and char == 'backspace':
-                                self.current_text_buffer = self.current_text_buffer[:-1]
-                                print("⌫", end="", flush=True)
+                                self.current_text_buffer.pop()
                             else:
                                 # Flush buffer and record the delete key
                                 self.flush_text_buffer()
                                 command = f"press {char}"
                                 self.events.append(command)
-                                print(f"[{current_time - self.start_time:.1f}s] {command}")
+                                self.log(f"[{self.elapsed(current_ns):.1f}s] {command}")
                         else:
                             # Other special keys - flush text buffer and add press command
                             self.flush_text_buffer()
                             command = f"press {char}"
                             self.events.append(command)
-                            print(f"[{current_time - self.start_time:.1f}s] {command}")
+                            self.log(f"[{self.elapsed(current_ns):.1f}s] {command}")
                             
                             # Add automatic delay after return keys for code editors
                             if char == 'return':
                                 self.events.append("wait 0.25")
-                                print(f"[Added return delay: 0.25s]")
+                                self.log(f"[Added return delay: 0.25s]")
                     else:
                         # Regular character - add to text buffer silently
-                        self.current_text_buffer += char
-                        print(".", end="", flush=True)  # Simple progress indicator
+                        self.current_text_buffer.append(char)
         
         return event
     
@@ -425,6 +656,8 @@ class ScriptRecorder:
             print("No events recorded")
             return
         
+        self.events = list(compact_events(self.events, self.merge_waits))
+        
         # Save locations if they were modified
         self.save_locations()
         
@@ -432,13 +665,18 @@ class ScriptRecorder:
         script_filename = f"{self.recording_folder}/script.txt"
         
         # Count new locations created
-        new_locations = self.click_counter - 1
+        new_locations = self.new_location_count
+        
+        # Capture timestamps once so the header, info.json and summary agree
+        now = datetime.now()
+        now_str = now.strftime('%Y-%m-%d %H:%M:%S')
+        duration = self.elapsed(time.monotonic_ns())
         
         # Add header comment
         script_lines = [
             f"# Recording ID: {self.recording_id}",
-            f"# Recorded: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            f"# Duration: {time.time() - self.start_time:.1f} seconds",
+            f"# Recorded: {now_str}",
+            f"# Duration: {duration:.1f} seconds",
             f"# Total commands: {len(self.events)}",
             f"# New locations saved: {new_locations}",
             "",
@@ -450,30 +688,29 @@ class ScriptRecorder:
         # Add events
         script_lines.extend(self.events)
         
-        # Write script file
-        with open(script_filename, 'w') as f:
-            f.write('\n'.join(script_lines))
+        # Queue script file for writing
+        self.write_file(script_filename, '\n'.join(script_lines).encode())
         
         # Create a summary file
         summary_filename = f"{self.recording_folder}/info.json"
         summary_data = {
             "id": self.recording_id,
-            "created": datetime.now().isoformat(),
-            "duration": time.time() - self.start_time,
+            "created": now.isoformat(),
+            "duration": duration,
             "commands": len(self.events),
             "locations": new_locations,
-            "description": f"Recording from {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            "description": f"Recording from {now_str}"
         }
         
-        with open(summary_filename, 'w') as f:
-            json.dump(summary_data, f, indent=2)
-        
-        print(f"\n✅ Recording saved: {self.recording_id}")
-        print(f"📁 Folder: {self.recording_folder}")
-        print(f"📝 Commands: {len(self.events)}")
-        print(f"📍 New locations: {new_locations}")
-        print(f"⏱️ Duration: {time.time() - self.start_time:.1f} seconds")
-        print(f"\n🚀 To run: ./bin/play {self.recording_id}")
+        # Files are written in order, so the summary prints once everything is saved
+        self.write_file(summary_filename, dump_json(summary_data), '\n'.join([
+            f"\n✅ Recording saved: {self.recording_id}",
+            f"📁 Folder: {self.recording_folder}",
+            f"📝 Commands: {len(self.events)}",
+            f"📍 New locations: {new_locations}",
+            f"⏱️ Duration: {duration:.1f} seconds",
+            f"\n🚀 To run: ./bin/play {self.recording_id}",
+        ]))
     
     def start_recording(self):
         """Start the recording session"""
@@ -502,31 +739,26 @@ class ScriptRecorder:
             CGEventMaskBit(kCGEventKeyUp)
         )
         
-        tap = CGEventTapCreate(
-            kCGSessionEventTap,
-            kCGHeadInsertEventTap,
-            0,
-            mask,
-            self.event_callback,
-            None
-        )
-        
-        if not tap:
-            print("❌ Failed to create event tap. Check accessibility permissions:")
-            print("   System Settings > Privacy & Security > Privacy > Accessibility")
-            print("   Add Terminal/Python to allowed apps")
-            return False
-        
-        try:
-            source = CFMachPortCreateRunLoopSource(None, tap, 0)
-            CFRunLoopAddSource(CFRunLoopGetCurrent(), source, kCFRunLoopDefaultMode)
-            CFRunLoopRun()
-        except KeyboardInterrupt:
-            print("\n\n👋 Recorder stopped")
-            if self.is_recording:
-                print("⚠️  Recording was in progress but not saved")
-            CFRunLoopStop(CFRunLoopGetCurrent())
-        
+        with event_tap(mask, self.event_callback) as tap:
+            if not tap:
+                print("❌ Failed to create event tap. Check accessibility permissions:")
+                print("   System Settings > Privacy & Security > Privacy > Accessibility")
+                print("   Add Terminal/Python to allowed apps")
+                return False
+            
+            try:
+                # Run in short slices so Ctrl+C is noticed even when no events
+                # arrive; stopping the run loop from the callback ends it
+                while CFRunLoopRunInMode(kCFRunLoopDefaultMode, 0.25, False) == kCFRunLoopRunTimedOut:
+                    pass
+            except KeyboardInterrupt:
+                self.flush_log()
+                print("\n\n👋 Recorder stopped")
+                if self.is_recording:
+                    print("⚠️  Recording was in progress but not saved")
+        
+        # Make sure queued files hit the disk before exiting
+        self._write_queue.join()
         return True
 
 def main():
@@ -534,10 +766,12 @@ def main():
     parser = argparse.ArgumentParser(description='Record actions and convert to Simon Says script format')
     parser.add_argument('--locations',
                        help='Base locations file for smart click detection (optional)')
+    parser.add_argument('--sum-waits', action='store_true',
+                       help='Add up back-to-back waits instead of keeping the longest')
     
     args = parser.parse_args()
     
-    recorder = ScriptRecorder(args.locations)
+    recorder = ScriptRecorder(args.locations, sum if args.sum_waits else max)
     recorder.start_recording()
 
 if __name__ == '__main__':
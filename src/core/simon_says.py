@@ -5,19 +5,35 @@ Simon Says using clipboard paste approach - much more reliable for code editors
 
 import json
 import time
+import sys
 import os
 import re
-import subprocess
+import threading
+import queue
+try:
+    import orjson  # Optional: faster JSON parsing when installed
+except ImportError:
+    orjson = None
+from collections import OrderedDict
 from Quartz import (
     CGEventCreateMouseEvent, CGEventCreateKeyboardEvent,
-    CGEventPost, kCGHIDEventTap, CGPointMake,
+    CGEventPost, CGEventPostToPid, kCGHIDEventTap, CGPointMake,
     kCGEventLeftMouseDown, kCGEventLeftMouseUp,
     kCGEventRightMouseDown, kCGEventRightMouseUp,
     kCGEventMouseMoved,
     kCGMouseButtonLeft, kCGMouseButtonRight,
-    CGEventCreate, CGEventGetLocation,
-    CGEventKeyboardSetUnicodeString
+    CGEventCreate, CGEventGetLocation, CGEventGetType,
+    kCGEventKeyDown, kCGEventKeyUp, kCGKeyboardEventKeycode,
+    CGEventKeyboardSetUnicodeString,
+    CGEventSetFlags, kCGEventFlagMaskShift, kCGEventFlagMaskCommand,
+    kCGEventFlagMaskControl, kCGEventFlagMaskAlternate,
+    CGEventMaskBit, CGEventGetIntegerValueField,
+    kCGEventOtherMouseDown, kCGMouseEventButtonNumber,
+    CFRunLoopRunInMode, kCFRunLoopDefaultMode
 )
+from AppKit import NSPasteboard, NSPasteboardTypeString, NSWorkspace
+from Foundation import NSProcessInfo
+from event_tap import event_tap
 
 # Key codes for common keys
 KEYCODES = {
@@ -47,24 +63,363 @@ SHIFT_CHARS = {
     ' ': 'space', '\n': 'return', '\t': 'tab'
 }
 
+# Modifier flag -> modifier keycode, in press order (for discrete modifier presses)
+MODIFIER_KEYS = (
+    (kCGEventFlagMaskCommand, 55),
+    (kCGEventFlagMaskControl, 59),
+    (kCGEventFlagMaskShift, 56),
+    (kCGEventFlagMaskAlternate, 58),
+)
+
+# Down event type -> the up event type that lets go of it (for cancel_pending)
+RELEASE_TYPES = {
+    kCGEventLeftMouseDown: kCGEventLeftMouseUp,
+    kCGEventRightMouseDown: kCGEventRightMouseUp,
+    kCGEventKeyDown: kCGEventKeyUp,
+}
+UP_TYPES = frozenset(RELEASE_TYPES.values())
+
+# Modifier names accepted in "press cmd+shift+<key>" -> event flag
+MODIFIER_FLAGS = {
+    'cmd': kCGEventFlagMaskCommand, 'command': kCGEventFlagMaskCommand,
+    'ctrl': kCGEventFlagMaskControl, 'control': kCGEventFlagMaskControl,
+    'shift': kCGEventFlagMaskShift,
+    'option': kCGEventFlagMaskAlternate, 'alt': kCGEventFlagMaskAlternate,
+}
+
+# Every typable character -> (keycode, needs_shift)
+CHAR_TO_EVENT = {char: (code, False) for char, code in KEYCODES.items() if len(char) == 1}
+CHAR_TO_EVENT.update(
+    (char.upper(), (code, True)) for char, code in KEYCODES.items()
+    if len(char) == 1 and char.isalpha()
+)
+CHAR_TO_EVENT.update(
+    (char, (KEYCODES[base], True)) for char, base in SHIFT_CHARS.items()
+)
+CHAR_TO_EVENT.update({
+    ' ': (KEYCODES['space'], False),
+    '\n': (KEYCODES['return'], False),
+    '\t': (KEYCODES['tab'], False),
+})
+
+# ASCII view of CHAR_TO_EVENT as immutable bytes indexed by ord(char)
+NO_KEY = 0xFF  # Keycode slot for characters that can't be typed
+CHAR_KEYCODE_TABLE = bytes(
+    CHAR_TO_EVENT[chr(c)][0] if chr(c) in CHAR_TO_EVENT else NO_KEY for c in range(128)
+)
+CHAR_SHIFT_TABLE = bytes(
+    CHAR_TO_EVENT[chr(c)][1] if chr(c) in CHAR_TO_EVENT else 0 for c in range(128)
+)
+
+# Command argument shapes
+HOLD_ARGS_RE = re.compile(r'at\s+(.+?)(?:\s+for\s+(\S+))?$', re.IGNORECASE)
+DRAG_ARGS_RE = re.compile(r'(.+?)\s+to\s+(.+)$', re.IGNORECASE)
+CLICK_ARGS_RE = re.compile(r'at\s+(.+)$', re.IGNORECASE)
+WAIT_RE = re.compile(r'(\d+(?:\.\d+)?)')
+# The whole argument of "speed", so "speed 2x" or "speed abc 2" are rejected
+SPEED_RE = re.compile(r'\d+(?:\.\d+)?')
+COORD_RE = re.compile(r'\(?\s*(\d+)\s*,\s*(\d+)\s*\)?')
+
+def strip_quotes(text):
+    """Remove one pair of matching surrounding quotes"""
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in '"\'':
+        return text[1:-1]
+    return text
+
+# NSActivityUserInitiated | NSActivityLatencyCritical: no App Nap or timer coalescing
+LATENCY_CRITICAL_ACTIVITY = 0x00FFFFFF | 0xFF00000000
+
+# Remaining time below which sleep_until spins instead of sleeping; only macOS
+# sleeps overshoot enough to be worth spinning for
+SPIN_THRESHOLD = 0.0015 if sys.platform == 'darwin' else 0
+
+def sleep_until(deadline):
+    """Wait for a perf_counter deadline, spinning through the last millisecond
+    
+    Only for single-threaded waits such as move_mouse; spinning holds the GIL.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > SPIN_THRESHOLD:
+        time.sleep(remaining - SPIN_THRESHOLD)
+    while time.perf_counter() < deadline:
+        pass
+
+def precise_sleep(duration):
+    """Sleep for duration seconds without the usual macOS sleep overshoot"""
+    sleep_until(time.perf_counter() + duration)
+
+# Most recently used CGPoints kept by SimonSaysPaste.point
+POINT_CACHE_SIZE = 1024
+
+# CGEventKeyboardSetUnicodeString carries at most this many UTF-16 code units per event
+UNICODE_CHUNK = 20
+
+# parse_script states and the ops it yields
+STATE_IDLE, STATE_OPEN_FENCE, STATE_CODE_BLOCK = range(3)
+OP_COMMAND, OP_CODE_BLOCK = range(2)
+
+def parse_script(iter_lines):
+    """Turn script lines into (OP_COMMAND, line) and (OP_CODE_BLOCK, lines) ops"""
+    state = STATE_IDLE
+    code_block = []
+    
+    for line in iter_lines:
+        line_stripped = line.strip()
+        
+        if state == STATE_OPEN_FENCE:
+            # Skip everything up to the opening ```
+            if line_stripped == '```':
+                state = STATE_CODE_BLOCK
+            continue
+        
+        if state == STATE_CODE_BLOCK:
+            if line_stripped == '```':
+                yield OP_CODE_BLOCK, code_block
+                code_block = []
+                state = STATE_IDLE
+            else:
+                # Keep the exact line with all formatting
+                code_block.append(line.rstrip('\r\n'))
+            continue
+        
+        # Skip empty lines and comments
+        if not line_stripped or line_stripped.startswith('#'):
+            continue
+        
+        if line_stripped.lower().startswith('type code block'):
+            state = STATE_OPEN_FENCE
+        else:
+            yield OP_COMMAND, line_stripped
+    
+    # Unterminated code block still gets pasted
+    if state == STATE_CODE_BLOCK:
+        yield OP_CODE_BLOCK, code_block
+
+# Location a command moves the mouse to first, parsed the same way the handlers do
+TARGET_RES = (
+    re.compile(r'move mouse to\s*(.+)$', re.IGNORECASE),
+    re.compile(r'(?:left|right) click and hold\s*at\s+(.+?)(?:\s+for\s+\S+)?$', re.IGNORECASE),
+    re.compile(r'(?:left|right) click\s*at\s+(.+)$', re.IGNORECASE),
+    re.compile(r'drag (?:left|right) from\s*(.+?)\s+to\s+.+$', re.IGNORECASE),
+)
+
+def command_target(command):
+    """Lowercased location a command starts by moving to, or None"""
+    for target_re in TARGET_RES:
+        match = target_re.match(command)
+        if match:
+            return match.group(1).strip().lower()
+    return None
+
+def drop_redundant_moves(ops):
+    """Drop "move mouse to" ops when the next op moves to the same place anyway"""
+    held = None  # (op, target) of a move waiting to see the next op
+    for op in ops:
+        target = command_target(op[1]) if op[0] == OP_COMMAND else None
+        if held is not None and target != held[1]:
+            yield held[0]
+        held = None
+        
+        if target is not None and op[1].lower().startswith('move mouse to'):
+            held = (op, target)
+        else:
+            yield op
+    
+    if held is not None:
+        yield held[0]
+
+# Parsed JSON files keyed by (path, mtime_ns)
+_json_cache = {}
+
+def load_json_cached(path):
+    """Load a JSON file, reusing the parsed data while its mtime is unchanged"""
+    key = (path, os.stat(path).st_mtime_ns)
+    data = _json_cache.get(key)
+    if data is None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson else json.loads(raw)
+        _json_cache[key] = data
+    return data
+
 class SimonSaysPaste:
-    def __init__(self, locations_file, delay=0.06):
+    def __init__(self, locations_file, delay=0.06, verbose=False, bulk_paste=False, post_to_app=False,
+                 discrete_modifiers=False, fast_move=True, unicode_typing=False):
         self.locations = {}
+        self.location_points = {}  # lowercased name -> (x, y)
         self.delay = delay
+        self.verbose = verbose  # Echo every command and pasted line
+        self.bulk_paste = bulk_paste  # Paste whole code blocks in one go
+        self.post_to_app = post_to_app  # Send key events straight to the frontmost app
+        self.target_pid = None  # Process key events go to, None for the HID tap
+        self.discrete_modifiers = discrete_modifiers  # Press modifier keys around combos too
+        self.fast_move = fast_move  # Fewer, quicker animation steps for long moves
+        self.unicode_typing = unicode_typing  # Type printable text as Unicode string events
+        self.move_speed = 1.0  # Set by the "speed" command; 2 finishes moves twice as fast
+        self.pasteboard = NSPasteboard.generalPasteboard()
+        self.key_events = {}  # (keycode, is_down, flags) -> reusable CGEvent
+        self.modifiers_dirty = True  # Release once up front in case keys were left held
+        self.ready_time = 0.0  # perf_counter time the next event may be posted (pump thread)
+        self.post_queue = queue.Queue()  # (event or None, gap, pid) for the pump thread
+        self.wake = threading.Event()  # Set to cut short the gap the pump is waiting out
+        self.held = {}  # (up type, keycode or None) -> pid, for buttons/keys posted down (pump thread)
+        self.post_thread = threading.Thread(target=self.pump_events, daemon=True)
+        self.post_thread.start()
+        self.points = OrderedDict()  # (x, y) -> CGPoint, least recently used first
+        self.prewarm_key_events()
+        # Keep the activity token alive so the whole session stays latency critical
+        self.activity = NSProcessInfo.processInfo().beginActivityWithOptions_reason_(
+            LATENCY_CRITICAL_ACTIVITY, "Simon Says playback"
+        )
         self.load_locations(locations_file)
         
     def load_locations(self, locations_file):
         """Load saved locations from file"""
-        if os.path.exists(locations_file):
+        try:
+            self.locations = load_json_cached(locations_file)
+            print(f"Loaded {len(self.locations)} locations")
+        except FileNotFoundError:
+            print(f"Warning: No locations file found at {locations_file}")
+        except:
+            print(f"Warning: Could not load locations from {locations_file}")
+            self.locations = {}
+        
+        self.location_points = {
+            name.strip().lower(): (loc['x'], loc['y'])
+            for name, loc in self.locations.items()
+        }
+    
+    def key_event(self, keycode, down, flags=0):
+        """Get a cached keyboard event, creating it on first use
+        
+        Events are never modified after creation, so each modifier flag
+        combination gets its own cached event.
+        """
+        key = (keycode, down, flags)
+        event = self.key_events.get(key)
+        if event is None:
+            event = CGEventCreateKeyboardEvent(None, keycode, down)
+            if flags:
+                CGEventSetFlags(event, flags)
+            self.key_events[key] = event
+        return event
+    
+    def prewarm_key_events(self):
+        """Create the plain and shifted down/up events for every known key up front"""
+        for keycode in set(KEYCODES.values()):
+            for flags in (0, kCGEventFlagMaskShift):
+                self.key_event(keycode, True, flags)
+                self.key_event(keycode, False, flags)
+    
+    def post(self, event, gap, pid=None):
+        """Queue an event to be posted once the previous gap has passed, followed by its own gap
+        
+        Posting happens on the pump thread, so parsing the next command overlaps
+        with the gaps instead of adding to them. With a pid the event goes
+        straight to that process instead of through the HID tap.
+        """
+        self.post_queue.put((event, gap, pid))
+    
+    def post_key(self, event, gap):
+        """Queue a keyboard event for the target app (or the HID tap)"""
+        self.post_queue.put((event, gap, self.target_pid))
+    
+    def pause(self, duration):
+        """Queue a pause between events without posting anything"""
+        self.post_queue.put((None, duration, None))
+    
+    def pump_events(self,
+                    _perf_counter=time.perf_counter,
+                    _post=CGEventPost,
+                    _post_to_pid=CGEventPostToPid,
+                    _tap=kCGHIDEventTap):
+        """Post queued events in order, keeping each event's gap (runs on post_thread)
+        
+        The underscore defaults bind module globals as fast locals for this loop.
+        Gaps are a plain blocking wait: spinning here would hold the GIL
+        against the main thread while it parses the next command.
+        """
+        get, task_done = self.post_queue.get, self.post_queue.task_done
+        wait, clear = self.wake.wait, self.wake.clear
+        while True:
+            event, gap, pid = get()
             try:
-                with open(locations_file, 'r') as f:
-                    self.locations = json.load(f)
-                    print(f"Loaded {len(self.locations)} locations")
-            except:
-                print(f"Warning: Could not load locations from {locations_file}")
-                self.locations = {}
+                remaining = self.ready_time - _perf_counter()
+                if remaining > 0:
+                    wait(remaining)  # Returns early when cancel_pending sets wake
+                    clear()
+                if event is not None:
+                    if pid:
+                        _post_to_pid(pid, event)
+                    else:
+                        _post(_tap, event)
+                    self.track_held(event, pid)
+                self.ready_time = _perf_counter() + gap
+            except Exception as e:
+                # Keep pumping; a dead thread would leave flush() waiting forever
+                print(f"⚠️  Error posting event: {e}")
+            finally:
+                task_done()
+    
+    def flush(self):
+        """Wait until every queued event is posted and its gap has passed"""
+        self.post_queue.join()
+        sleep_until(self.ready_time)
+    
+    def track_held(self, event, pid):
+        """Remember which buttons and keys posted events have left down (pump thread)"""
+        event_type = CGEventGetType(event)
+        up_type = RELEASE_TYPES.get(event_type)
+        if up_type is None and event_type not in UP_TYPES:
+            return
+        keycode = None
+        if event_type == kCGEventKeyDown or event_type == kCGEventKeyUp:
+            keycode = CGEventGetIntegerValueField(event, kCGKeyboardEventKeycode)
+        if up_type is not None:
+            self.held[(up_type, keycode)] = pid
         else:
-            print(f"Warning: No locations file found at {locations_file}")
+            self.held.pop((event_type, keycode), None)
+    
+    def cancel_pending(self):
+        """Drop queued events that haven't been posted yet, then let go of anything held
+        
+        The main thread runs ahead of the pump, so a button or key may already
+        be down with its up event still queued (or not queued yet, mid-drag).
+        """
+        while True:
+            try:
+                self.post_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.post_queue.task_done()
+        
+        # Cut short the gap the pump is waiting out and let it finish its event
+        self.wake.set()
+        self.post_queue.join()
+        self.ready_time = 0.0
+        
+        for (up_type, keycode), pid in list(self.held.items()):
+            if keycode is not None:
+                self.post(self.key_event(keycode, False), 0.005, pid)
+            else:
+                button = kCGMouseButtonLeft if up_type == kCGEventLeftMouseUp else kCGMouseButtonRight
+                point = self.point(*self.get_current_mouse_position())
+                self.post(CGEventCreateMouseEvent(None, up_type, point, button), 0.005)
+        self.modifiers_dirty = True
+        self.release_all_modifiers()
+        self.flush()
+    
+    def point(self, x, y):
+        """Get a cached CGPoint for screen coordinates"""
+        key = (x, y)
+        point = self.points.get(key)
+        if point is None:
+            point = self.points[key] = CGPointMake(x, y)
+            if len(self.points) > POINT_CACHE_SIZE:
+                self.points.popitem(last=False)
+        else:
+            self.points.move_to_end(key)
+        return point
     
     def get_current_mouse_position(self):
         """Get current mouse position"""
@@ -72,14 +427,20 @@ class SimonSaysPaste:
         loc = CGEventGetLocation(event)
         return int(loc.x), int(loc.y)
     
-    def move_mouse(self, x, y, smooth=True, duration=0.2):
-        """Move mouse to specific coordinates with smooth animation"""
+    def move_mouse(self, x, y, smooth=True, duration=None, smooth_threshold=20):
+        """Move mouse to specific coordinates with smooth animation
+        
+        Moves shorter than smooth_threshold pixels jump straight to the target.
+        Without a duration, fast_move picks one from the distance (0.2s otherwise).
+        """
+        # Moves post directly, so let queued events go first
+        self.flush()
+        
         if not smooth:
             # Instant movement (old behavior)
-            point = CGPointMake(x, y)
+            point = self.point(x, y)
             move_event = CGEventCreateMouseEvent(None, kCGEventMouseMoved, point, 0)
             CGEventPost(kCGHIDEventTap, move_event)
-            time.sleep(0.1)
             return
         
         # Get current position
@@ -88,32 +449,60 @@ class SimonSaysPaste:
         # Calculate distance and steps
         distance = ((x - current_x)**2 + (y - current_y)**2)**0.5
         
-        # Determine number of steps based on distance (more steps for longer distances)
-        steps = max(10, min(int(distance / 10), 30))  # Between 10-30 steps
+        if distance < smooth_threshold:
+            move_event = CGEventCreateMouseEvent(None, kCGEventMouseMoved, self.point(x, y), 0)
+            CGEventPost(kCGHIDEventTap, move_event)
+            return
+        
+        if self.fast_move:
+            # Steps grow with the square root of distance; nobody is watching closely
+            steps = max(3, min(int(distance ** 0.5 / 2), 12))  # Between 3-12 steps
+            if duration is None:
+                duration = min(0.1, distance / 2000)
+        else:
+            # Determine number of steps based on distance (more steps for longer distances)
+            min_steps = 6 if distance < 100 else 10
+            steps = max(min_steps, min(int(distance / 10), 30))  # Between 6-30 steps
+        if duration is None:
+            duration = 0.2
+        duration /= self.move_speed
         
         # Calculate step increments
         dx = (x - current_x) / steps
         dy = (y - current_y) / steps
         step_delay = duration / steps
         
-        # Animate movement
-        for i in range(steps + 1):
-            intermediate_x = current_x + (dx * i)
-            intermediate_y = current_y + (dy * i)
-            
-            point = CGPointMake(intermediate_x, intermediate_y)
-            move_event = CGEventCreateMouseEvent(None, kCGEventMouseMoved, point, 0)
-            CGEventPost(kCGHIDEventTap, move_event)
-            time.sleep(step_delay)
+        # Build every event up front so the paced loop only posts
+        move_events = [
+            CGEventCreateMouseEvent(None, kCGEventMouseMoved, CGPointMake(current_x + dx * i, current_y + dy * i), 0)
+            for i in range(steps + 1)
+        ]
+        
+        # Animate movement, pacing each step against a fixed deadline so
+        # sleep overshoot doesn't accumulate across steps
+        post, tap = CGEventPost, kCGHIDEventTap
+        start = time.perf_counter()
+        for i, move_event in enumerate(move_events):
+            post(tap, move_event)
+            sleep_until(start + (i + 1) * step_delay)
+    
+    def move_before_click(self, x, y):
+        """Move to (x, y) and let the UI settle, unless the cursor is already there"""
+        # Check the live cursor: the user or a popup may have moved it since
+        # the last scripted move, and the app needs the hover before the click
+        self.flush()
+        if (x, y) != self.get_current_mouse_position():
+            self.move_mouse(x, y)
+            precise_sleep(0.05)  # Give UI time to respond to mouse movement
     
     def click_mouse(self, button='left', x=None, y=None):
         """Click mouse button at current or specified position"""
         if x is not None and y is not None:
-            self.move_mouse(x, y)
-            time.sleep(0.05)  # Give UI time to respond to mouse movement
-        
-        current_x, current_y = self.get_current_mouse_position()
-        point = CGPointMake(current_x, current_y)
+            self.move_before_click(x, y)
+        else:
+            # Only query the cursor when we didn't just put it somewhere
+            x, y = self.get_current_mouse_position()
+        point = self.point(x, y)
         
         if button == 'left':
             down_event = CGEventCreateMouseEvent(None, kCGEventLeftMouseDown, point, kCGMouseButtonLeft)
@@ -125,19 +514,16 @@ class SimonSaysPaste:
             print(f"Unknown button: {button}")
             return
         
-        CGEventPost(kCGHIDEventTap, down_event)
-        time.sleep(0.1)  # Longer click duration
-        CGEventPost(kCGHIDEventTap, up_event)
-        time.sleep(0.1)
+        self.post(down_event, 0.1)  # Longer click duration
+        self.post(up_event, 0.1)
     
     def click_and_hold(self, button='left', duration=0.4, x=None, y=None):
         """Click and hold mouse button for specified duration"""
         if x is not None and y is not None:
-            self.move_mouse(x, y)
-            time.sleep(0.05)
-        
-        current_x, current_y = self.get_current_mouse_position()
-        point = CGPointMake(current_x, current_y)
+            self.move_before_click(x, y)
+        else:
+            x, y = self.get_current_mouse_position()
+        point = self.point(x, y)
         
         if button == 'left':
             down_event = CGEventCreateMouseEvent(None, kCGEventLeftMouseDown, point, kCGMouseButtonLeft)
@@ -150,20 +536,17 @@ class SimonSaysPaste:
             return
         
         # Press and hold
-        CGEventPost(kCGHIDEventTap, down_event)
-        time.sleep(duration)  # Hold for specified duration
-        CGEventPost(kCGHIDEventTap, up_event)
-        time.sleep(0.05)
+        self.post(down_event, duration)  # Hold for specified duration
+        self.post(up_event, 0.05)
     
     def drag_mouse(self, button='left', from_x=None, from_y=None, to_x=None, to_y=None):
         """Drag mouse from one location to another"""
         # Move to start position
         if from_x is not None and from_y is not None:
-            self.move_mouse(from_x, from_y)
-            time.sleep(0.05)
-        
-        start_x, start_y = self.get_current_mouse_position()
-        start_point = CGPointMake(start_x, start_y)
+            self.move_before_click(from_x, from_y)
+        else:
+            from_x, from_y = self.get_current_mouse_position()
+        start_point = self.point(from_x, from_y)
         
         # Mouse down at start position
         if button == 'left':
@@ -174,104 +557,88 @@ class SimonSaysPaste:
             print(f"Unknown button: {button}")
             return
         
-        CGEventPost(kCGHIDEventTap, down_event)
-        time.sleep(0.1)
+        self.post(down_event, 0.1)
         
         # Drag to end position
         if to_x is not None and to_y is not None:
             self.move_mouse(to_x, to_y, smooth=True, duration=0.25)  # Slower drag movement
+        else:
+            to_x, to_y = self.get_current_mouse_position()
         
         # Mouse up at end position
-        end_x, end_y = self.get_current_mouse_position()
-        end_point = CGPointMake(end_x, end_y)
+        end_point = self.point(to_x, to_y)
         
         if button == 'left':
             up_event = CGEventCreateMouseEvent(None, kCGEventLeftMouseUp, end_point, kCGMouseButtonLeft)
         elif button == 'right':
             up_event = CGEventCreateMouseEvent(None, kCGEventRightMouseUp, end_point, kCGMouseButtonRight)
         
-        CGEventPost(kCGHIDEventTap, up_event)
-        time.sleep(0.05)
+        self.post(up_event, 0.05)
     
     def release_all_modifiers(self):
-        """Force release ALL modifier keys to prevent stuck states"""
+        """Release all modifier keys to prevent race conditions
+        
+        Skipped unless a key combo was sent since the last release.
+        """
+        if not self.modifiers_dirty:
+            return
+        
         modifiers = [
-            (55, 'cmd'),
+            (55, 'cmd'), 
+            (59, 'ctrl'), 
             (56, 'shift'), 
-            (57, 'caps lock'),
-            (58, 'option/alt'),
-            (59, 'control'),
-            (60, 'right shift'),
-            (61, 'right option'),
-            (62, 'right control'),
-            (63, 'fn')  # Function key - THIS is the problematic one!
+            (58, 'option'),
+            (63, 'fn')  # Function key - this could be the culprit!
         ]
-        
         for keycode, name in modifiers:
             try:
-                # Send key up event for each modifier
-                up_event = CGEventCreateKeyboardEvent(None, keycode, False)
-                CGEventPost(kCGHIDEventTap, up_event)
+                self.post_key(self.key_event(keycode, False), 0)
             except:
-                pass  # Ignore errors for non-existent keycodes
-        
-        # Small delay to ensure all releases are processed
-        time.sleep(0.01)
-    
+                pass
+        self.pause(0.005)
+        self.modifiers_dirty = False
     
     def press_key_combo(self, key, cmd=False, ctrl=False, shift=False, option=False):
         """Press a key combination"""
-        if key not in KEYCODES:
+        keycode = KEYCODES.get(key)
+        if keycode is None:
             print(f"Unknown key: {key}")
             return
         
-        keycode = KEYCODES[key]
-        
-        # Press modifiers
+        # Modifiers ride on the key events as flags instead of separate key presses
+        flags = 0
         if cmd:
-            cmd_down = CGEventCreateKeyboardEvent(None, 55, True)
-            CGEventPost(kCGHIDEventTap, cmd_down)
+            flags |= kCGEventFlagMaskCommand
         if ctrl:
-            ctrl_down = CGEventCreateKeyboardEvent(None, 59, True)
-            CGEventPost(kCGHIDEventTap, ctrl_down)
+            flags |= kCGEventFlagMaskControl
         if shift:
-            shift_down = CGEventCreateKeyboardEvent(None, 56, True)
-            CGEventPost(kCGHIDEventTap, shift_down)
+            flags |= kCGEventFlagMaskShift
         if option:
-            option_down = CGEventCreateKeyboardEvent(None, 58, True)
-            CGEventPost(kCGHIDEventTap, option_down)
-        
-        time.sleep(0.005)
-        
-        # Press main key
-        key_down = CGEventCreateKeyboardEvent(None, keycode, True)
-        CGEventPost(kCGHIDEventTap, key_down)
-        time.sleep(0.005)
-        
-        key_up = CGEventCreateKeyboardEvent(None, keycode, False)
-        CGEventPost(kCGHIDEventTap, key_up)
-        time.sleep(0.005)
+            flags |= kCGEventFlagMaskAlternate
+        self.press_keycode(keycode, flags)
+    
+    def press_keycode(self, keycode, flags):
+        """Press a key with its modifier flags already resolved"""
+        self.modifiers_dirty = True
         
-        # Release modifiers in reverse order
-        if option:
-            option_up = CGEventCreateKeyboardEvent(None, 58, False)
-            CGEventPost(kCGHIDEventTap, option_up)
-        if shift:
-            shift_up = CGEventCreateKeyboardEvent(None, 56, False)
-            CGEventPost(kCGHIDEventTap, shift_up)
-        if ctrl:
-            ctrl_up = CGEventCreateKeyboardEvent(None, 59, False)
-            CGEventPost(kCGHIDEventTap, ctrl_up)
-        if cmd:
-            cmd_up = CGEventCreateKeyboardEvent(None, 55, False)
-            CGEventPost(kCGHIDEventTap, cmd_up)
+        if not self.discrete_modifiers:
+            self.post_key(self.key_event(keycode, True, flags), 0.005)
+            self.post_key(self.key_event(keycode, False, flags), 0.005)
+            return
         
-        time.sleep(0.005)
-    
+        # Fallback for apps that only honor real modifier key presses
+        held = [code for mask, code in MODIFIER_KEYS if flags & mask]
+        for code in held:
+            self.post_key(self.key_event(code, True, flags), 0.005)
+        self.post_key(self.key_event(keycode, True, flags), 0.005)
+        self.post_key(self.key_event(keycode, False, flags), 0.005)
+        for code in reversed(held):
+            self.post_key(self.key_event(code, False), 0.005)
     
     def type_key(self, key):
         """Type a single key"""
-        if key not in KEYCODES:
+        keycode = KEYCODES.get(key)
+        if keycode is None:
             print(f"Unknown key: {key}")
             return
         
@@ -280,73 +647,112 @@ class SimonSaysPaste:
         if key in ['e', '.', 'd']:
             self.release_all_modifiers()
         
-        keycode = KEYCODES[key]
-        
         # Special handling for return key with longer timing
         if key == 'return':
-            down_event = CGEventCreateKeyboardEvent(None, keycode, True)
-            CGEventPost(kCGHIDEventTap, down_event)
-            time.sleep(0.1)  # Longer press duration
-            
-            up_event = CGEventCreateKeyboardEvent(None, keycode, False)
-            CGEventPost(kCGHIDEventTap, up_event)
-            time.sleep(0.05)
+            self.post_key(self.key_event(keycode, True), 0.1)  # Longer press duration
+            self.post_key(self.key_event(keycode, False), 0.05)
             
         else:
             # Standard key handling
-            down_event = CGEventCreateKeyboardEvent(None, keycode, True)
-            CGEventPost(kCGHIDEventTap, down_event)
-            time.sleep(0.01)
-            
-            up_event = CGEventCreateKeyboardEvent(None, keycode, False)
-            CGEventPost(kCGHIDEventTap, up_event)
-            time.sleep(0.01)
+            self.post_key(self.key_event(keycode, True), 0.01)
+            self.post_key(self.key_event(keycode, False), 0.01)
     
-    def release_all_modifiers(self):
-        """Release all modifier keys to prevent race conditions"""
-        modifiers = [
-            (55, 'cmd'), 
-            (59, 'ctrl'), 
-            (56, 'shift'), 
-            (58, 'option'),
-            (63, 'fn')  # Function key - this could be the culprit!
-        ]
-        for keycode, name in modifiers:
-            try:
-                up_event = CGEventCreateKeyboardEvent(None, keycode, False)
-                CGEventPost(kCGHIDEventTap, up_event)
-            except:
-                pass
-        time.sleep(0.005)
+    def copy_to_clipboard(self, text):
+        """Put text on the clipboard (in-process, no pbcopy subprocess)"""
+        # A queued Cmd+V must paste the old contents before they are replaced
+        self.flush()
+        self.pasteboard.clearContents()
+        self.pasteboard.setString_forType_(text, NSPasteboardTypeString)
     
-    def type_text(self, text):
-        """Type text character by character (fallback for simple text)"""
+    def paste_line(self, line):
+        """Paste a single line at the start of the current line"""
+        # Jump to line start so editor auto-indent doesn't double the indentation
+        self.type_key('home')
+        self.copy_to_clipboard(line.rstrip())  # Drop trailing whitespace
+        self.press_key_combo('v', cmd=True)
+        self.pause(0.01)  # Let the paste land before the next queued event
+    
+    def type_text_unicode(self, text):
+        """Type text as Unicode string key events, a chunk of characters per event
+        
+        The string replaces the keycode, so no modifier state or keymap is involved.
+        Chunks are measured in UTF-16 code units; characters past U+FFFF take two.
+        """
+        chunk_start = 0
+        units = 0
         for i, char in enumerate(text):
-            # Extra safety: release modifiers before ANY 'e', '.', or 'd' character
-            if char.lower() in ['e', 'd'] or char == '.':
-                self.release_all_modifiers()
-            
-            if char == ' ':
-                self.type_key('space')
-            elif char == '\n':
-                self.type_key('return')
-            elif char == '\t':
-                self.type_key('tab')
-            elif char in SHIFT_CHARS and char not in [' ', '\n', '\t']:
-                base_key = SHIFT_CHARS[char]
-                if base_key in KEYCODES:
-                    self.press_key_combo(base_key, shift=True)
-            elif char.isupper():
-                # For uppercase E and D, be extra careful
-                if char in ['E', 'D']:
-                    self.release_all_modifiers()
-                    time.sleep(0.05)
-                self.press_key_combo(char.lower(), shift=True)
-            elif char.lower() in KEYCODES:
-                self.type_key(char.lower())
+            width = 2 if ord(char) > 0xFFFF else 1
+            if units + width > UNICODE_CHUNK:
+                self.post_unicode_chunk(text[chunk_start:i], units)
+                chunk_start, units = i, 0
+            units += width
+        if units:
+            self.post_unicode_chunk(text[chunk_start:], units)
+    
+    def post_unicode_chunk(self, chunk, length):
+        """Queue a key down/up pair carrying chunk (length UTF-16 code units)"""
+        for down in (True, False):
+            event = CGEventCreateKeyboardEvent(None, 0, down)
+            CGEventKeyboardSetUnicodeString(event, length, chunk)
+            self.post_key(event, 0.002)
+    
+    def type_text_fast(self, text):
+        """Type text by posting pre-resolved key events back to back
+        
+        Shift is carried as a flag on the key events rather than separate
+        shift key presses. Returns False without typing anything if the text
+        has a character that can't be typed this way.
+        """
+        events = []
+        for char in text:
+            c = ord(char)
+            if c < 128:
+                keycode = CHAR_KEYCODE_TABLE[c]
+                if keycode == NO_KEY:
+                    return False
+                shift = CHAR_SHIFT_TABLE[c]
             else:
+                resolved = CHAR_TO_EVENT.get(char)
+                if resolved is None:
+                    return False
+                keycode, shift = resolved
+            flags = kCGEventFlagMaskShift if shift else 0
+            events.append(self.key_event(keycode, True, flags))
+            events.append(self.key_event(keycode, False, flags))
+        
+        # Start from a clean modifier state (avoids Fn+E/D/. emoji picker)
+        self.release_all_modifiers()
+        for event in events:
+            self.post_key(event, 0.002)
+        return True
+    
+    def type_text(self, text):
+        """Type text as key presses, or as Unicode string events with unicode_typing"""
+        # Unicode events skip the keymap but carry keycode 0, which apps that
+        # read the keycode misinterpret; newlines and tabs always need real keys
+        if self.unicode_typing and text.isprintable():
+            self.type_text_unicode(text)
+            return
+        
+        if not self.type_text_fast(text):
+            self.type_text_per_key(text)
+    
+    def type_text_per_key(self, text):
+        """Type text character by character, skipping characters that can't be typed"""
+        # One release up front covers the whole string (avoids Fn+E/D/. emoji picker)
+        self.release_all_modifiers()
+        
+        # Each queued key event carries a 5ms gap, so the pump does the pacing
+        for char in text:
+            c = ord(char)
+            resolved = (CHAR_KEYCODE_TABLE[c], CHAR_SHIFT_TABLE[c]) if c < 128 else CHAR_TO_EVENT.get(char)
+            if resolved is None or resolved[0] == NO_KEY:
                 print(f"Cannot type character: {char}")
-            time.sleep(0.005)
+            else:
+                keycode, shift = resolved
+                flags = kCGEventFlagMaskShift if shift else 0
+                self.post_key(self.key_event(keycode, True, flags), 0.005)
+                self.post_key(self.key_event(keycode, False, flags), 0.005)
     
     def execute_command(self, command):
         """Execute a single command"""
@@ -355,316 +761,332 @@ class SimonSaysPaste:
         if not command or command.startswith('#'):
             return
         
-        print(f"Executing: {command}")
-        
-        if command.lower().startswith('left click and hold'):
-            # Parse: "left click and hold at location for 2.5s"
-            parts = command.lower().split('at', 1)
-            if len(parts) > 1:
-                location_and_duration = parts[1].strip()
-                if 'for' in location_and_duration:
-                    location, duration_part = location_and_duration.split('for', 1)
-                    location = location.strip()
-                    duration_str = duration_part.strip().rstrip('s')
-                    try:
-                        duration = float(duration_str)
-                    except:
-                        duration = 0.4
-                else:
-                    location = location_and_duration
-                    duration = 1.0
-                
-                if location in self.locations:
-                    loc = self.locations[location]
-                    self.click_and_hold('left', duration, loc['x'], loc['y'])
-                else:
-                    print(f"Unknown location: {location}")
-            else:
-                self.click_and_hold('left', 1.0)
-                
-        elif command.lower().startswith('right click and hold'):
-            # Parse: "right click and hold at location for 2.5s"
-            parts = command.lower().split('at', 1)
-            if len(parts) > 1:
-                location_and_duration = parts[1].strip()
-                if 'for' in location_and_duration:
-                    location, duration_part = location_and_duration.split('for', 1)
-                    location = location.strip()
-                    duration_str = duration_part.strip().rstrip('s')
-                    try:
-                        duration = float(duration_str)
-                    except:
-                        duration = 0.4
-                else:
-                    location = location_and_duration
-                    duration = 1.0
-                
-                if location in self.locations:
-                    loc = self.locations[location]
-                    self.click_and_hold('right', duration, loc['x'], loc['y'])
-                else:
-                    print(f"Unknown location: {location}")
-            else:
-                self.click_and_hold('right', 1.0)
-                
-        elif command.lower().startswith('drag left from') or command.lower().startswith('drag right from'):
-            # Parse: "drag left from location1 to location2"
-            button = 'left' if 'drag left' in command.lower() else 'right'
-            parts = command.lower().split('from', 1)[1].strip()
-            if 'to' in parts:
-                from_loc, to_loc = parts.split('to', 1)
-                from_loc = from_loc.strip()
-                to_loc = to_loc.strip()
-                
-                if from_loc in self.locations and to_loc in self.locations:
-                    from_pos = self.locations[from_loc]
-                    to_pos = self.locations[to_loc]
-                    self.drag_mouse(button, from_pos['x'], from_pos['y'], to_pos['x'], to_pos['y'])
-                else:
-                    print(f"Unknown location: {from_loc} or {to_loc}")
-            else:
-                print("Drag command missing 'to' location")
-                
-        elif command.lower().startswith('left click'):
-            if 'at' in command:
-                parts = command.split('at', 1)[1].strip()
-                if parts in self.locations:
-                    loc = self.locations[parts]
-                    self.click_mouse('left', loc['x'], loc['y'])
-                else:
-                    print(f"Unknown location: {parts}")
-            else:
-                self.click_mouse('left')
-                
-        elif command.lower().startswith('right click'):
-            if 'at' in command:
-                parts = command.split('at', 1)[1].strip()
-                if parts in self.locations:
-                    loc = self.locations[parts]
-                    self.click_mouse('right', loc['x'], loc['y'])
-                else:
-                    print(f"Unknown location: {parts}")
-            else:
-                self.click_mouse('right')
-                
-        elif command.lower().startswith('move mouse to'):
-            location = command[13:].strip()
-            if location in self.locations:
-                loc = self.locations[location]
-                self.move_mouse(loc['x'], loc['y'])
-            else:
-                match = re.match(r'\(?\s*(\d+)\s*,\s*(\d+)\s*\)?', location)
-                if match:
-                    x, y = int(match.group(1)), int(match.group(2))
-                    self.move_mouse(x, y)
-                else:
-                    print(f"Unknown location: {location}")
-                    
-        elif command.lower().startswith('press'):
-            key_combo = command[5:].strip()
+        if self.verbose:
+            print(f"Executing: {command}")
+        
+        try:
+            run, resolved = self.compile_command(command)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
+        run(self, *resolved)
+    
+    def compile_command(self, command):
+        """Resolve a command once into (run, args) for run(self, *args)
+        
+        Each verb's parse step resolves locations, durations and keys, so a
+        command that can't run raises ValueError here instead of partway
+        through a script.
+        """
+        match = self.COMMAND_RE.match(command)
+        if not match:
+            raise ValueError(f"Unknown command: {command}")
+        
+        verb, args = match.groups()
+        parse, run = self.COMMAND_HANDLERS[verb.lower()]
+        try:
+            return run, parse(self, args.strip())
+        except ValueError as e:
+            raise ValueError(f"{command}: {e}") from None
+    
+    def compile_script(self, iter_lines):
+        """Parse and check a whole script before anything runs
+        
+        Returns (program, errors). Commands become (OP_COMMAND, (run, args, line))
+        so running them needs no more string matching.
+        """
+        program = []
+        errors = []
+        for op, arg in drop_redundant_moves(parse_script(iter_lines)):
+            if op == OP_CODE_BLOCK:
+                program.append((op, arg))
+                continue
             
-            # Check if it's a key combination (contains +)
-            if '+' in key_combo:
-                parts = key_combo.split('+')
-                modifiers = parts[:-1]  # All but last are modifiers
-                key = parts[-1].strip().lower()
-                
-                # Convert modifier names
-                cmd = 'cmd' in modifiers or 'command' in modifiers
-                ctrl = 'ctrl' in modifiers or 'control' in modifiers  
-                shift = 'shift' in modifiers
-                option = 'option' in modifiers or 'alt' in modifiers
-                
-                if key in KEYCODES:
-                    print(f"  Pressing key combo: {key_combo}")
-                    self.press_key_combo(key, cmd=cmd, ctrl=ctrl, shift=shift, option=option)
-                else:
-                    print(f"Unknown key in combo: {key}")
-            else:
-                # Simple key press
-                key = key_combo.lower()
-                if key in KEYCODES:
-                    print(f"  Pressing key: '{key}'")
-                    self.type_key(key)
-                else:
-                    print(f"Unknown key: {key}")
-                    
-        elif command.lower().startswith('newline') or command.lower() == 'new line':
-            # Alternative newline method for problematic editors
+            try:
+                run, resolved = self.compile_command(arg)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+            program.append((op, (run, resolved, arg)))
+        return program, errors
+    
+    def location_point(self, name):
+        """(x, y) of a saved location, ValueError if there is no such location"""
+        name = name.strip()
+        point = self.location_points.get(name.lower())
+        if point is None:
+            raise ValueError(f"unknown location '{name}'")
+        return point
+    
+    def parse_click_and_hold(self, button, args):
+        """Parse "[at location [for 2.5s]]" into click_and_hold arguments"""
+        match = HOLD_ARGS_RE.match(args)
+        if not match:
+            return button, 1.0, None, None
+        
+        location, duration_str = match.groups()
+        duration = 1.0
+        if duration_str is not None:
+            try:
+                duration = float(duration_str.rstrip('s'))
+            except ValueError:
+                raise ValueError(f"bad hold duration '{duration_str}'") from None
+        return (button, duration, *self.location_point(location))
+    
+    def parse_drag(self, button, args):
+        """Parse "location1 to location2" into drag_mouse arguments"""
+        match = DRAG_ARGS_RE.match(args)
+        if not match:
+            raise ValueError("missing 'to' location")
+        
+        from_loc, to_loc = match.groups()
+        return (button, *self.location_point(from_loc), *self.location_point(to_loc))
+    
+    def parse_click(self, button, args):
+        """Parse "[at location]" into click_mouse arguments"""
+        match = CLICK_ARGS_RE.match(args)
+        if not match:
+            return button, None, None
+        return (button, *self.location_point(match.group(1)))
+    
+    def parse_move(self, args):
+        """Parse "<location or (x, y)>" into move_mouse arguments"""
+        point = self.location_points.get(args.lower())
+        if point:
+            return point
+        match = COORD_RE.match(args)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+        raise ValueError(f"unknown location '{args}'")
+    
+    def parse_press(self, args):
+        """Parse "<key>" or "cmd+shift+<key>" into (key, modifier flags)"""
+        *modifiers, key = args.split('+')
+        key = key.strip().lower()
+        if key not in KEYCODES:
+            raise ValueError(f"unknown key '{key}'")
+        
+        flags = 0
+        for name in modifiers:
+            flag = MODIFIER_FLAGS.get(name.strip().lower())
+            if flag is None:
+                raise ValueError(f"unknown modifier '{name.strip()}'")
+            flags |= flag
+        return key, flags
+    
+    def parse_text(self, args):
+        """Parse "<text>" or "\"<text>\"" into the text itself"""
+        return (strip_quotes(args),)
+    
+    def parse_no_args(self, args):
+        """Commands that ignore anything after the verb"""
+        return ()
+    
+    def parse_wait(self, args):
+        """Parse "<seconds>" into a pause duration (1 second if none is given)"""
+        match = WAIT_RE.search(args)
+        return (float(match.group(1)) if match else 1,)
+    
+    def parse_speed(self, args):
+        """Parse "<factor>" into a move speed factor above 0"""
+        factor = float(args) if SPEED_RE.fullmatch(args) else 0
+        if factor <= 0:
+            raise ValueError("speed needs a factor above 0")
+        return (factor,)
+    
+    def do_press(self, key, flags):
+        """Handle: "press <key>" or "press cmd+shift+<key>" """
+        if self.verbose:
+            print(f"  Pressing key: '{key}'")
+        if flags:
+            self.press_keycode(KEYCODES[key], flags)
+        else:
+            self.type_key(key)
+    
+    def do_newline(self):
+        """Handle: "newline" - alternative newline method for problematic editors"""
+        if self.verbose:
             print("  Creating newline (clipboard method)")
-            self.copy_to_clipboard('\n')
-            time.sleep(0.05)
-            self.press_key_combo('v', cmd=True)
-            time.sleep(0.05)
-            
-        elif command.lower().startswith('paste newline') or command.lower().startswith('paste line'):
-            # Paste text with newline at the end using clipboard
-            if 'paste line' in command.lower():
-                text = command.split('paste line', 1)[1].strip()
-            else:
-                text = command.split('paste newline', 1)[1].strip()
-            
-            if text.startswith('"') and text.endswith('"'):
-                text = text[1:-1]
-            elif text.startswith("'") and text.endswith("'"):
-                text = text[1:-1]
-            
+        self.copy_to_clipboard('\n')
+        self.pause(0.05)
+        self.press_key_combo('v', cmd=True)
+        self.pause(0.05)
+    
+    def do_paste_line(self, text):
+        """Handle: "paste line <text>" - paste text with a newline at the end"""
+        if self.verbose:
             print(f"  Pasting line with newline: '{text}'")
-            self.copy_to_clipboard(text + '\n')
-            time.sleep(0.05)
+        self.copy_to_clipboard(text + '\n')
+        self.pause(0.05)
+        self.press_key_combo('v', cmd=True)
+        self.pause(0.05)
+    
+    def do_type_line(self, text):
+        """Handle: "type line <text>" - type text then press return"""
+        self.type_text(text)
+        self.type_key('return')
+    
+    def do_speed(self, factor):
+        """Handle: "speed <factor>" - scale how long mouse moves take"""
+        self.move_speed = factor
+    
+    # Command verb (lowercase) -> (parse(self, args) -> resolved args, run(self, *resolved args))
+    COMMAND_HANDLERS = {
+        'left click and hold': (lambda self, args: self.parse_click_and_hold('left', args), click_and_hold),
+        'right click and hold': (lambda self, args: self.parse_click_and_hold('right', args), click_and_hold),
+        'drag left from': (lambda self, args: self.parse_drag('left', args), drag_mouse),
+        'drag right from': (lambda self, args: self.parse_drag('right', args), drag_mouse),
+        'left click': (lambda self, args: self.parse_click('left', args), click_mouse),
+        'right click': (lambda self, args: self.parse_click('right', args), click_mouse),
+        'move mouse to': (parse_move, move_mouse),
+        'press': (parse_press, do_press),
+        'newline': (parse_no_args, do_newline),
+        'new line': (parse_no_args, do_newline),
+        'paste newline': (parse_text, do_paste_line),
+        'paste line': (parse_text, do_paste_line),
+        'type line': (parse_text, do_type_line),
+        'type': (parse_text, type_text),
+        'wait': (parse_wait, pause),
+        'sleep': (parse_wait, pause),
+        'speed': (parse_speed, do_speed),
+    }
+    
+    # Verb and arguments, built from the handler table; longest verbs first so
+    # "left click and hold" wins over "left click"
+    COMMAND_RE = re.compile(
+        '(' + '|'.join(sorted(map(re.escape, COMMAND_HANDLERS), key=len, reverse=True)) + ')(.*)',
+        re.IGNORECASE | re.DOTALL
+    )
+    
+    def execute_script(self, script_text):
+        """Execute a script with multiple commands"""
+        if self.execute_stream(iter(script_text.splitlines())):
+            print("Script execution completed")
+    
+    def paste_code_block(self, code_block):
+        """Paste collected code block lines one by one"""
+        if not code_block:
+            return
+        
+        print(f"Pasting code block ({len(code_block)} lines)")
+        
+        if self.bulk_paste:
+            # One clipboard write and one paste for the whole block; only safe
+            # in editors that don't re-indent pasted text
+            self.type_key('home')
+            self.copy_to_clipboard('\n'.join(line.rstrip() for line in code_block) + '\n')
             self.press_key_combo('v', cmd=True)
-            time.sleep(0.05)
-                
-        elif command.lower().startswith('type line'):
-            text = command[9:].strip()
-            if text.startswith('"') and text.endswith('"'):
-                text = text[1:-1]
-            elif text.startswith("'") and text.endswith("'"):
-                text = text[1:-1]
-            self.type_text(text)
-            self.type_key('return')
+            self.pause(0.05)
+            self.pause(self.delay)
+            return
+        
+        for idx, code_line in enumerate(code_block):
+            if self.verbose:
+                print(f"  Line {idx+1}: '{code_line}'")
             
-        elif command.lower().startswith('type'):
-            text = command[4:].strip()
-            if text.startswith('"') and text.endswith('"'):
-                text = text[1:-1]
-            elif text.startswith("'") and text.endswith("'"):
-                text = text[1:-1]
-            self.type_text(text)
+            # Paste the line (this handles indentation properly)
+            self.paste_line(code_line)
             
-        elif command.lower().startswith('wait') or command.lower().startswith('sleep'):
-            match = re.search(r'(\d+(?:\.\d+)?)', command)
-            if match:
-                duration = float(match.group(1))
-                time.sleep(duration)
-            else:
-                time.sleep(1)
-                
-        else:
-            print(f"Unknown command: {command}")
+            # Press return to go to next line
+            self.type_key('return')
+            self.pause(0.05)
+        
+        self.pause(self.delay)
     
-    def execute_script(self, script_text):
-        """Execute a script with multiple commands"""
+    def execute_stream(self, iter_lines):
+        """Execute commands from any iterable of lines (a string's lines or an open file)
+        
+        Returns True if the whole script ran, False if it was rejected or stopped.
+        """
+        if self.post_to_app:
+            self.target_pid = NSWorkspace.sharedWorkspace().frontmostApplication().processIdentifier()
+        
+        program, errors = self.compile_script(iter_lines)
+        if errors:
+            # Fail before typing anything rather than partway through the script
+            print("❌ Script not run:")
+            for error in errors:
+                print(f"  {error}")
+            return False
+        
         try:
-            lines = script_text.split('\n')
-            i = 0
-            
-            while i < len(lines):
-                line_stripped = lines[i].strip()
-                
-                # Skip empty lines and comments
-                if not line_stripped or line_stripped.startswith('#'):
-                    i += 1
-                    continue
-                
-                # Check for code block command
-                if line_stripped.lower() == 'type code block' or line_stripped.lower().startswith('type code block'):
-                    i += 1
-                    code_block = []
-                    
-                    # Look for the opening ```
-                    while i < len(lines) and lines[i].strip() != '```':
-                        i += 1
-                    
-                    if i < len(lines):
-                        i += 1  # Skip the opening ```
-                        
-                        # Collect lines until closing ```
-                        while i < len(lines) and not (lines[i].strip() == '```'):
-                            # Keep the exact line with all formatting
-                            code_block.append(lines[i])
-                            i += 1
-                        
-                        # Paste the code block line by line
-                        if code_block:
-                            print(f"Pasting code block ({len(code_block)} lines)")
-                            
-                            for idx, code_line in enumerate(code_block):
-                                print(f"  Line {idx+1}: '{code_line}'")
-                                
-                                # Paste the line (this handles indentation properly)
-                                self.paste_line(code_line)
-                                
-                                # Press return to go to next line
-                                self.type_key('return')
-                                time.sleep(0.05)
-                            
-                            time.sleep(self.delay)
-                        
-                        i += 1  # Skip the closing ```
+            for op, arg in program:
+                if op == OP_CODE_BLOCK:
+                    self.paste_code_block(arg)
                 else:
-                    # Regular command
-                    self.execute_command(line_stripped)
-                    time.sleep(self.delay)
-                    i += 1
+                    run, resolved, line = arg
+                    if self.verbose:
+                        print(f"Executing: {line}")
+                    run(self, *resolved)
+                    self.pause(self.delay)
+            self.flush()
         
         except KeyboardInterrupt:
+            self.cancel_pending()
             print("\n🛑 Playback stopped by user")
-            return
+            return False
         
-        print("Script execution completed")
+        return True
     
     def execute_file(self, filename):
         """Execute commands from a file"""
         try:
             with open(filename, 'r') as f:
-                script = f.read()
-            print(f"Executing script from {filename}")
-            self.execute_script(script)
-            print("Script execution completed")
+                print(f"Executing script from {filename}")
+                ran = self.execute_stream(f)
+            if ran:
+                print("Script execution completed")
         except FileNotFoundError:
             print(f"Script file not found: {filename}")
         except Exception as e:
             print(f"Error executing script: {e}")
 
 def wait_for_middle_click():
-    """Wait for middle mouse click to start execution"""
-    from Quartz import (
-        CGEventMaskBit, CGEventTapCreate, CGEventGetIntegerValueField,
-        kCGEventOtherMouseDown, kCGMouseEventButtonNumber,
-        kCGSessionEventTap, kCGHeadInsertEventTap,
-        CFRunLoopGetCurrent, CFRunLoopRun, CFRunLoopStop,
-        CFMachPortCreateRunLoopSource, CFRunLoopAddSource, kCFRunLoopDefaultMode
-    )
+    """Wait for middle mouse click to start execution
     
+    The tap runs on its own thread and run loop; the main thread just waits
+    on an Event so Ctrl+C is handled promptly.
+    """
     middle_clicked = [False]  # Use list for closure
+    done = threading.Event()
     
     def middle_click_callback(proxy, event_type, event, refcon):
         if event_type == kCGEventOtherMouseDown:
             button = CGEventGetIntegerValueField(event, kCGMouseEventButtonNumber)
             if button == 2:  # Middle mouse button
                 middle_clicked[0] = True
-                CFRunLoopStop(CFRunLoopGetCurrent())
+                done.set()
                 return None  # Consume the middle click event
         return event
     
     print("Middle click to start execution...")
     print("Press Ctrl+C to cancel")
     
-    # Create event tap for middle mouse click
+    # Event tap for middle mouse click
     mask = CGEventMaskBit(kCGEventOtherMouseDown)
-    tap = CGEventTapCreate(
-        kCGSessionEventTap,
-        kCGHeadInsertEventTap,
-        0,
-        mask,
-        middle_click_callback,
-        None
-    )
     
-    if not tap:
-        print("Failed to create event tap. Check accessibility permissions.")
-        return False
+    def run_tap():
+        # Leaving the block tears the tap down right away so it stops
+        # seeing clicks during playback
+        with event_tap(mask, middle_click_callback) as tap:
+            if not tap:
+                print("Failed to create event tap. Check accessibility permissions.")
+                done.set()
+                return
+            # Run in short slices so a cancel from the main thread is noticed
+            while not done.is_set():
+                CFRunLoopRunInMode(kCFRunLoopDefaultMode, 0.25, True)
     
+    tap_thread = threading.Thread(target=run_tap, daemon=True)
+    tap_thread.start()
     try:
-        source = CFMachPortCreateRunLoopSource(None, tap, 0)
-        CFRunLoopAddSource(CFRunLoopGetCurrent(), source, kCFRunLoopDefaultMode)
-        CFRunLoopRun()
-        return middle_clicked[0]
+        while not done.wait(0.25):
+            pass
     except KeyboardInterrupt:
         print("\nCancelled by user")
-        CFRunLoopStop(CFRunLoopGetCurrent())
-        return False
+        done.set()
+    tap_thread.join()
+    return middle_clicked[0]
 
 def main():
     import argparse
@@ -676,31 +1098,47 @@ def main():
                        help='Delay between commands in seconds (default: 0.1)')
     parser.add_argument('--countdown', action='store_true',
                        help='Use countdown instead of middle click trigger')
+    parser.add_argument('--verbose', action='store_true',
+                       help='Print each command and pasted line as it runs')
+    parser.add_argument('--bulk-paste', action='store_true',
+                       help='Paste each code block with a single clipboard write')
+    parser.add_argument('--post-to-app', action='store_true',
+                       help='Send key events to the app that is frontmost when playback starts')
+    parser.add_argument('--discrete-modifiers', action='store_true',
+                       help='Press modifier keys separately for apps that ignore flagged key combos')
+    parser.add_argument('--smooth-moves', action='store_true',
+                       help='Animate mouse moves with more steps instead of the quick default')
+    parser.add_argument('--unicode-typing', action='store_true',
+                       help='Type text as Unicode string events, 20 characters per event')
     
     args = parser.parse_args()
     
     if args.script:
+        # Scan the recordings folder once instead of stat-ing paths one by one
+        try:
+            with os.scandir("recordings") as entries:
+                recordings = {entry.name for entry in entries if entry.is_dir()}
+        except FileNotFoundError:
+            recordings = None
+        
         # Check if it's a recording ID or a file path
-        if os.path.exists(f"recordings/{args.script}/script.txt"):
+        recording_dir = f"recordings/{args.script}"
+        if recordings and args.script in recordings and os.path.isfile(f"{recording_dir}/script.txt"):
             # It's a recording ID
             recording_id = args.script
-            script_file = f"recordings/{recording_id}/script.txt"
-            locations_file = f"recordings/{recording_id}/locations.json"
-            
-            # Create SimonSaysPaste with recording-specific locations
-            simon = SimonSaysPaste(locations_file, args.delay)
+            script_file = f"{recording_dir}/script.txt"
+            locations_file = f"{recording_dir}/locations.json"
             
             # Load info
-            info_file = f"recordings/{recording_id}/info.json"
-            if os.path.exists(info_file):
-                with open(info_file, 'r') as f:
-                    info = json.load(f)
-                print(f"🎬 Playing recording: {recording_id}")
+            try:
+                info = load_json_cached(f"{recording_dir}/info.json")
+            except FileNotFoundError:
+                info = None
+            print(f"🎬 Playing recording: {recording_id}")
+            if info is not None:
                 print(f"📅 Created: {info.get('created', 'unknown')}")
                 print(f"⏱️ Duration: {info.get('duration', 0):.1f}s")
                 print(f"📝 Commands: {info.get('commands', 0)}")
-            else:
-                print(f"🎬 Playing recording: {recording_id}")
         
         elif os.path.exists(args.script):
             # It's a regular file path
@@ -708,27 +1146,26 @@ def main():
             if not args.locations:
                 print("❌ --locations argument required for regular script files")
                 return
-            simon = SimonSaysPaste(args.locations, args.delay)
+            locations_file = args.locations
         else:
             print(f"❌ Recording '{args.script}' not found")
             print("Available recordings:")
-            if os.path.exists("recordings"):
-                recordings = [d for d in os.listdir("recordings") if os.path.isdir(f"recordings/{d}")]
-                if recordings:
-                    for recording in sorted(recordings):
-                        info_file = f"recordings/{recording}/info.json"
-                        if os.path.exists(info_file):
-                            with open(info_file, 'r') as f:
-                                info = json.load(f)
-                            print(f"  📁 {recording} - {info.get('description', 'No description')}")
-                        else:
-                            print(f"  📁 {recording}")
-                else:
-                    print("  (no recordings found)")
-            else:
+            if recordings is None:
                 print("  (recordings folder doesn't exist)")
+            elif not recordings:
+                print("  (no recordings found)")
+            else:
+                for recording in sorted(recordings):
+                    try:
+                        info = load_json_cached(f"recordings/{recording}/info.json")
+                        print(f"  📁 {recording} - {info.get('description', 'No description')}")
+                    except FileNotFoundError:
+                        print(f"  📁 {recording}")
             return
         
+        simon = SimonSaysPaste(locations_file, args.delay, args.verbose, args.bulk_paste, args.post_to_app,
+                               args.discrete_modifiers, not args.smooth_moves, args.unicode_typing)
+        
         # Execute script file
         if args.countdown:
             # Old countdown method
@@ -747,8 +1184,13 @@ def main():
         if not args.locations:
             print("❌ --locations argument required for interactive mode")
             return
+        if args.post_to_app:
+            # The frontmost app here is the terminal taking the commands
+            print("❌ --post-to-app only works when running a script")
+            return
             
-        simon = SimonSaysPaste(args.locations, args.delay)
+        simon = SimonSaysPaste(args.locations, args.delay, args.verbose, args.bulk_paste, args.post_to_app,
+                               args.discrete_modifiers, not args.smooth_moves, args.unicode_typing)
         print("\n=== Simon Says Paste Mode ===")
         print("Enter commands (or 'quit' to exit):")
         print("This version uses clipboard for reliable code pasting")
@@ -760,7 +1202,9 @@ def main():
                 if cmd.lower() in ['quit', 'exit', 'q']:
                     break
                 simon.execute_command(cmd)
+                simon.flush()
             except KeyboardInterrupt:
+                simon.cancel_pending()
                 print("\nExiting...")
                 break
 
@@ -2,15 +2,41 @@ from Quartz.CoreGraphics import (
     CGEventCreateMouseEvent,
     CGEventPost,
     CGEventCreateKeyboardEvent,
+    CGEventSourceCreate,
+    CGEventSetFlags,
     kCGEventLeftMouseDown,
     kCGEventLeftMouseUp,
     kCGEventKeyDown,
     kCGEventKeyUp,
     kCGHIDEventTap,
-    kCGMouseButtonLeft
+    kCGMouseButtonLeft,
+    kCGEventSourceStateHIDSystemState,
+    kCGEventFlagMaskCommand
 )
+from AppKit import NSPasteboard, NSPasteboardTypeString
 import time
 
+# Map characters to keycodes (only lowercase letters here)
+KEYCODE_MAP = {
+    'a': 0x00, 'b': 0x0B, 'c': 0x08, 'd': 0x02, 'e': 0x0E,
+    'f': 0x03, 'g': 0x05, 'h': 0x04, 'i': 0x22, 'j': 0x26,
+    'k': 0x28, 'l': 0x25, 'm': 0x2E, 'n': 0x2D, 'o': 0x1F,
+    'p': 0x23, 'q': 0x0C, 'r': 0x0F, 's': 0x01, 't': 0x11,
+    'u': 0x20, 'v': 0x09, 'w': 0x0D, 'x': 0x07, 'y': 0x10,
+    'z': 0x06, ' ': 0x31
+}
+
+# ASCII code -> keycode; characters typeString drops map to NO_KEY and are listed in SKIPPED
+NO_KEY = 0xFF
+KEYMAP = bytes(KEYCODE_MAP.get(chr(code), NO_KEY) for code in range(128))
+SKIPPED = bytes(code for code in range(128) if KEYMAP[code] == NO_KEY)
+
+# Strings longer than this are pasted instead of typed key by key
+PASTE_THRESHOLD = 4
+
+# How long Cmd+V gets to read the pasteboard before the old text goes back
+PASTE_RESTORE_DELAY = 0.1
+
 def mouseEvent(type, x, y):
     event = CGEventCreateMouseEvent(None, type, (x, y), kCGMouseButtonLeft)
     CGEventPost(kCGHIDEventTap, event)
@@ -24,26 +50,46 @@ def keyEvent(keycode, keyDown):
     event = CGEventCreateKeyboardEvent(None, keycode, keyDown)
     CGEventPost(kCGHIDEventTap, event)
 
+def pasteString(string):
+    # One clipboard write and one Cmd+V, however long the string is.
+    # The user's clipboard text is put back afterwards (other types are lost)
+    pasteboard = NSPasteboard.generalPasteboard()
+    saved = pasteboard.stringForType_(NSPasteboardTypeString)
+    pasteboard.clearContents()
+    pasteboard.setString_forType_(string, NSPasteboardTypeString)
+    for keyDown in (True, False):
+        event = CGEventCreateKeyboardEvent(None, KEYCODE_MAP['v'], keyDown)
+        CGEventSetFlags(event, kCGEventFlagMaskCommand)
+        CGEventPost(kCGHIDEventTap, event)
+    time.sleep(PASTE_RESTORE_DELAY)  # let the paste read the pasteboard first
+    pasteboard.clearContents()
+    if saved is not None:
+        pasteboard.setString_forType_(saved, NSPasteboardTypeString)
+
 def typeString(string):
-    # Map characters to keycodes (only lowercase letters here)
-    keycode_map = {
-        'a': 0x00, 'b': 0x0B, 'c': 0x08, 'd': 0x02, 'e': 0x0E,
-        'f': 0x03, 'g': 0x05, 'h': 0x04, 'i': 0x22, 'j': 0x26,
-        'k': 0x28, 'l': 0x25, 'm': 0x2E, 'n': 0x2D, 'o': 0x1F,
-        'p': 0x23, there once was a monkey named 'q': 0x0C, 'r': 0x0F, 's': 0x01, 't': 0x11,
-        'u': 0x20, 'v': 0x09, 'w': 0x0D, 'x': 0x07, 'y': 0x10,
-        'z': 0x06, ' ': 0x31
-    }
-    for char in string.lower():
-        if char in keycode_map:
-            keycode = keycode_map[char]
-            keyEvent(keycode, True)   # key down
-            keyEvent(keycode, False)  # key up
-            time.sleep(0.05)          # small delay between keys
-
-# Coordinates where to click
-x, y = 900, 300
-
-mouseClick(x, y)
-time.sleep(0.2)  # wait for click to register
-typeString("hello")
+    # Only lowercase letters and spaces are typed. Everything else is dropped
+    # before choosing typing or pasting, so the result doesn't depend on length
+    keys = string.lower().encode('ascii', 'ignore').translate(None, SKIPPED)
+    if len(keys) > PASTE_THRESHOLD:
+        pasteString(keys.decode('ascii'))
+        return
+    
+    # Build every event from one source first, then post them back to back;
+    # the HID tap keeps them in order without a sleep per key
+    source = CGEventSourceCreate(kCGEventSourceStateHIDSystemState)
+    events = []
+    for code in keys:
+        keycode = KEYMAP[code]
+        events.append(CGEventCreateKeyboardEvent(source, keycode, True))   # key down
+        events.append(CGEventCreateKeyboardEvent(source, keycode, False))  # key up
+    for event in events:
+        CGEventPost(kCGHIDEventTap, event)
+    time.sleep(0.005)  # let the last key land before the caller moves on
+
+if __name__ == "__main__":
+    # Coordinates where to click
+    x, y = 900, 300
+    
+    mouseClick(x, y)
+    time.sleep(0.2)  # wait for click to register
+    typeString("hello")
@@ -1,6 +1,7 @@
 from Quartz import CGEventMaskBit, CGEventTapCreate, CGEventGetLocation
 from Quartz import kCGEventLeftMouseDown, kCGEventRightMouseDown, kCGSessionEventTap
-from Quartz import kCGHeadInsertEventTap, CFRunLoopGetCurrent, CFRunLoopRun, CFRunLoopStop
+from Quartz import kCGEventTapOptionListenOnly
+from Quartz import kCGHeadInsertEventTap, CFRunLoopGetCurrent, CFRunLoopRunInMode
 from Quartz import CFMachPortCreateRunLoopSource, CFRunLoopAddSource, kCFRunLoopDefaultMode
 
 def mouse_click_callback(proxy, event_type, event, refcon):
@@ -20,10 +21,11 @@ try:
     mask = (CGEventMaskBit(kCGEventLeftMouseDown) | 
             CGEventMaskBit(kCGEventRightMouseDown))
     
+    # Only reports clicks, so a passive tap never holds up mouse input
     tap = CGEventTapCreate(
         kCGSessionEventTap,
         kCGHeadInsertEventTap,
-        0,
+        kCGEventTapOptionListenOnly,
         mask,
         mouse_click_callback,
         None
@@ -32,7 +34,9 @@ try:
     if tap:
         source = CFMachPortCreateRunLoopSource(None, tap, 0)
         CFRunLoopAddSource(CFRunLoopGetCurrent(), source, kCFRunLoopDefaultMode)
-        CFRunLoopRun()
+        # Run in short slices so Ctrl+C is noticed even when nobody clicks
+        while True:
+            CFRunLoopRunInMode(kCFRunLoopDefaultMode, 0.25, False)
     else:
         print("Failed to create event tap. You may need to grant accessibility permissions.")
         print("Go to System Preferences > Security & Privacy > Privacy > Accessibility")
@@ -40,4 +44,3 @@ try:
         
 except KeyboardInterrupt:
     print("\nStopped.")
-    CFRunLoopStop(CFRunLoopGetCurrent())
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+pytest.importorskip('Quartz')
+
+import simon_says
+from simon_says import OP_CODE_BLOCK, OP_COMMAND, SimonSaysPaste, drop_redundant_moves, parse_script
+
+
+@pytest.fixture
+def simon(tmp_path):
+    locations = tmp_path / 'locations.json'
+    locations.write_text(json.dumps({'Submit Button': {'x': 5, 'y': 6}, 'Name Field': {'x': 7, 'y': 8}}))
+    return SimonSaysPaste(str(locations))
+
+
+def test_parse_script_skips_blanks_and_comments():
+    lines = ['# setup', '', '  left click at Submit Button  ', 'wait 1']
+    assert list(parse_script(lines)) == [
+        (OP_COMMAND, 'left click at Submit Button'),
+        (OP_COMMAND, 'wait 1'),
+    ]
+
+
+def test_parse_script_collects_code_blocks():
+    lines = ['type hello', 'type code block', '```', 'def f():\n', '    pass\n', '```', 'press return']
+    assert list(parse_script(lines)) == [
+        (OP_COMMAND, 'type hello'),
+        (OP_CODE_BLOCK, ['def f():', '    pass']),
+        (OP_COMMAND, 'press return'),
+    ]
+
+
+def test_parse_script_keeps_unterminated_code_block():
+    lines = ['type code block', '```', '  x = 1']
+    assert list(parse_script(lines)) == [(OP_CODE_BLOCK, ['  x = 1'])]
+
+
+def test_drop_redundant_moves():
+    ops = [
+        (OP_COMMAND, 'move mouse to Submit Button'),
+        (OP_COMMAND, 'left click at submit button'),
+        (OP_COMMAND, 'move mouse to Name Field'),
+        (OP_COMMAND, 'drag left from Name Field to Submit Button'),
+        (OP_COMMAND, 'move mouse to Name Field'),
+        (OP_COMMAND, 'right click and hold at Submit Button for 2s'),
+        (OP_COMMAND, 'move mouse to (1, 2)'),
+    ]
+    assert list(drop_redundant_moves(ops)) == [
+        (OP_COMMAND, 'left click at submit button'),
+        (OP_COMMAND, 'drag left from Name Field to Submit Button'),
+        (OP_COMMAND, 'move mouse to Name Field'),
+        (OP_COMMAND, 'right click and hold at Submit Button for 2s'),
+        (OP_COMMAND, 'move mouse to (1, 2)'),
+    ]
+
+
+def test_drop_redundant_moves_keeps_moves_before_code_blocks():
+    ops = [(OP_COMMAND, 'move mouse to Submit Button'), (OP_CODE_BLOCK, ['left click at Submit Button'])]
+    assert list(drop_redundant_moves(ops)) == ops
+
+
+def test_compile_script_resolves_arguments(simon):
+    program, errors = simon.compile_script([
+        'left click at submit button',
+        'right click and hold at Name Field for 2.5s',
+        'drag left from Submit Button to Name Field',
+        'move mouse to (10, 20)',
+        'wait 0.5',
+        'type "hi"',
+        'speed 2',
+    ])
+    assert errors == []
+    resolved = [(run.__name__, args) for run, args, line in (arg for op, arg in program)]
+    assert resolved == [
+        ('click_mouse', ('left', 5, 6)),
+        ('click_and_hold', ('right', 2.5, 7, 8)),
+        ('drag_mouse', ('left', 5, 6, 7, 8)),
+        ('move_mouse', (10, 20)),
+        ('pause', (0.5,)),
+        ('type_text', ('hi',)),
+        ('do_speed', (2.0,)),
+    ]
+
+
+def test_compile_script_resolves_key_combos(simon):
+    program, errors = simon.compile_script(['press cmd+Shift+z', 'press return'])
+    assert errors == []
+    (_, (_, combo, _)), (_, (_, plain, _)) = program
+    assert combo == ('z', simon_says.kCGEventFlagMaskCommand | simon_says.kCGEventFlagMaskShift)
+    assert plain == ('return', 0)
+
+
+@pytest.mark.parametrize('line, problem', [
+    ('left click at Cancel Button', "unknown location 'Cancel Button'"),
+    ('drag left from Submit Button', "missing 'to' location"),
+    ('move mouse to nowhere', "unknown location 'nowhere'"),
+    ('press cmd+nope', "unknown key 'nope'"),
+    ('press hyper+a', "unknown modifier 'hyper'"),
+    ('left click and hold at Submit Button for longs', "bad hold duration 'longs'"),
+    ('speed 0', 'speed needs a factor above 0'),
+    ('speed 2x', 'speed needs a factor above 0'),
+    ('speed abc 2', 'speed needs a factor above 0'),
+])
+def test_compile_script_reports_bad_commands(simon, line, problem):
+    program, errors = simon.compile_script(['type fine', line])
+    assert errors == [f'{line}: {problem}']
+
+
+def test_compile_script_reports_unknown_verbs(simon):
+    program, errors = simon.compile_script(['jump around'])
+    assert errors == ['Unknown command: jump around']